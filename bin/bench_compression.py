@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2026 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""bench_compression.py [options]
+
+Measure when compressing cached data pays for itself.
+
+Saves and loads typical cached payloads (the GitHub releases JSON
+cached by the updater and lists of 1,000 and 100,000 VPN connections)
+with the default serializer at each zlib <level>, and reports the
+file size and median save and load times.
+
+Compression costs CPU time and saves bytes that would otherwise be
+written to and read from disk. The "break-even" column is the disk
+throughput below which the bytes saved outweigh the extra CPU time,
+i.e. compression makes a save plus a load faster on disks slower than
+that (or always, if compression is faster anyway).
+
+Usage:
+    bench_compression.py [-r <n>] [-l <level>...]
+    bench_compression.py -h
+
+Options:
+    -r, --repeat <n>       Number of runs per case [default: 5].
+    -l, --level <level>    zlib levels to test [default: 1 6 9].
+    -h, --help             Show this message and exit.
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+                   __file__))), 'src')
+sys.path.insert(0, SRC)
+
+import docopt  # noqa: E402
+from workflow import manager  # noqa: E402
+from workflow.cache import dump_data, load_data  # noqa: E402
+
+# Same fields as `vpn.VPN`
+VPN = namedtuple('VPN', ['name', 'active', 'host', 'protocol'])
+
+COUNTRIES = [u'DE', u'AT', u'CH', u'FR', u'PL', u'CZ', u'SE', u'US', u'GB']
+CITIES = [u'Frankfurt', u'Zürich', u'München', u'Vienna', u'Paris',
+          u'Kraków', u'Prague', u'Malmö', u'New York', u'London']
+
+
+def releases(count=30):
+    """Generate GitHub API response with ``count`` releases."""
+    random.seed(count)
+    data = []
+    for i in range(count, 0, -1):
+        tag = 'v3.{}'.format(i)
+        url = 'https://api.github.com/repos/deanishe/alfred-vpn-manager'
+        data.append({
+            'url': '{}/releases/{}'.format(url, 1000 + i),
+            'html_url': 'https://github.com/deanishe/alfred-vpn-manager/'
+                        'releases/tag/{}'.format(tag),
+            'id': 1000 + i,
+            'tag_name': tag,
+            'name': 'Version {}'.format(tag),
+            'draft': False,
+            'prerelease': i % 5 == 0,
+            'created_at': '2019-07-{:02d}T10:00:00Z'.format(i % 28 + 1),
+            'author': {'login': 'deanishe', 'id': 747913,
+                       'url': 'https://api.github.com/users/deanishe'},
+            'body': '\n'.join('- Fixed issue #{}'.format(random.randint(
+                              1, 200)) for _ in range(random.randint(2, 8))),
+            'assets': [{
+                'url': '{}/releases/assets/{}'.format(url, 5000 + i),
+                'name': 'VPN-Switcher-{}.alfredworkflow'.format(tag),
+                'content_type': 'application/octet-stream',
+                'size': random.randint(400000, 500000),
+                'download_count': random.randint(0, 5000),
+                'browser_download_url': 'https://github.com/deanishe/'
+                                        'alfred-vpn-manager/releases/download/'
+                                        '{0}/VPN-Switcher-{0}.alfredworkflow'
+                                        .format(tag),
+            }],
+        })
+
+    # update.py caches the raw response
+    return json.dumps(data, indent=2)
+
+
+def connections(count):
+    """Generate ``count`` VPN connections."""
+    random.seed(count)
+    return [VPN(u'{} {} #{}'.format(random.choice(COUNTRIES),
+                                    random.choice(CITIES), i),
+                i == 0, u'vpn{}.example.com'.format(i), u'udp')
+            for i in range(count)]
+
+
+PAYLOADS = [
+    ('releases', releases),
+    ('servers-1000', lambda: connections(1000)),
+    ('servers-100000', lambda: connections(100000)),
+]
+
+
+def median(values):
+    """Return median of ``values``."""
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def run_case(data, path, level, repeat):
+    """Return median save & load times in milliseconds and file size."""
+    serializer = manager.serializer('cpickle')
+    dumps, loads = [], []
+    for _ in range(repeat):
+        start = timer()
+        with open(path, 'wb') as fp:
+            dump_data(serializer, data, fp, level)
+        dumps.append((timer() - start) * 1000)
+
+        start = timer()
+        with open(path, 'rb') as fp:
+            load_data(serializer, fp)
+        loads.append((timer() - start) * 1000)
+
+    return median(dumps), median(loads), os.path.getsize(path)
+
+
+def breakeven(base, result):
+    """Return disk throughput below which compression pays, as text."""
+    extra = (result[0] + result[1]) - (base[0] + base[1])  # ms
+    saved = 2 * (base[2] - result[2])  # bytes written + read
+    if saved <= 0:
+        return 'never'
+    if extra <= 0:
+        return 'always'
+
+    return '{:.1f} MB/s'.format(saved / 1024.0 / 1024 / (extra / 1000.0))
+
+
+def main():
+    """Run benchmarks."""
+    args = docopt.docopt(__doc__)
+    repeat = int(args['--repeat'])
+    levels = [int(l) for s in args['--level'] for l in s.split()]
+
+    print(u'{:<24s} {:>9s} {:>9s} {:>10s}  {}'.format(
+          u'payload/level', u'save ms', u'load ms', u'bytes', u'break-even'))
+    tempdir = tempfile.mkdtemp()
+    try:
+        for name, func in PAYLOADS:
+            data = func()
+            path = os.path.join(tempdir, name)
+            base = run_case(data, path, 0, repeat)
+            for level in [0] + levels:
+                result = base if not level else run_case(data, path, level,
+                                                         repeat)
+                print(u'{:<24s} {:9.2f} {:9.2f} {:10d}  {}'.format(
+                      '{}/{}'.format(name, level), result[0], result[1],
+                      result[2], '-' if not level else breakeven(base,
+                                                                 result)))
+    finally:
+        shutil.rmtree(tempdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2026 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""bench_filter.py [options] [<size>...]
+
+Benchmark and regression suite for `Workflow.filter`.
+
+Generates synthetic VPN profile names in three variants (plain ASCII,
+accented city names and delimiter-heavy names) for each <size>, and
+times `Workflow.filter` with each `MATCH_*` rule, with and without
+diacritic folding, and with combinations of `min_score` and
+`max_results`. Each case runs several times and the median and 95th
+percentile are reported.
+
+Results can be saved as JSON with --output. With --baseline, p95
+timings are compared to a previous run, and the script exits with
+status 1 if any case is more than --threshold times slower.
+
+Usage:
+    bench_filter.py [-r <n>] [-o <file>] [-b <file>] [-t <ratio>] [<size>...]
+    bench_filter.py -h
+
+Options:
+    -r, --repeat <n>         Number of runs per case [default: 5].
+    -o, --output <file>      Save results to JSON file.
+    -b, --baseline <file>    Compare results to those in JSON file.
+    -t, --threshold <ratio>  Maximum p95 slowdown vs baseline [default: 1.25].
+    -h, --help               Show this message and exit.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+                   __file__))), 'src')
+sys.path.insert(0, SRC)
+
+import docopt  # noqa: E402
+from workflow import (  # noqa: E402
+    Workflow,
+    MATCH_ALL,
+    MATCH_ALLCHARS,
+    MATCH_ATOM,
+    MATCH_CAPITALS,
+    MATCH_INITIALS_CONTAIN,
+    MATCH_INITIALS_STARTSWITH,
+    MATCH_STARTSWITH,
+    MATCH_SUBSTRING,
+)
+from workflow.workflow import _fold_to_ascii  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+# Differences smaller than this many milliseconds are noise,
+# regardless of the ratio
+MIN_REGRESSION_MS = 1.0
+
+COUNTRIES = [u'DE', u'AT', u'CH', u'FR', u'PL', u'CZ', u'SE', u'US', u'GB']
+ASCII_CITIES = [u'Frankfurt', u'Berlin', u'Vienna', u'Geneva', u'Paris',
+                u'Warsaw', u'Prague', u'Stockholm', u'New York', u'London']
+ACCENTED_CITIES = [u'Zürich', u'München', u'Düsseldorf', u'Köln', u'Malmö',
+                   u'Kraków', u'Łódź', u'Gdańsk', u'České Budějovice',
+                   u'Reykjavík', u'Besançon', u'Saint-Étienne']
+PROTOCOLS = [u'UDP', u'TCP']
+
+# Queries for each variant. Each run filters the list once per query.
+QUERIES = {
+    'ascii': [u'fra', u'ny', u'stock 12', u'dfu'],
+    'diacritic': [u'zur', u'lodz', u'ceske b', u'se'],
+    'delimiter': [u'fra', u'de-b', u'udp 11', u'gbl'],
+}
+
+RULES = [
+    ('STARTSWITH', MATCH_STARTSWITH),
+    ('CAPITALS', MATCH_CAPITALS),
+    ('ATOM', MATCH_ATOM),
+    ('INITIALS_STARTSWITH', MATCH_INITIALS_STARTSWITH),
+    ('INITIALS_CONTAIN', MATCH_INITIALS_CONTAIN),
+    ('SUBSTRING', MATCH_SUBSTRING),
+    ('ALLCHARS', MATCH_ALLCHARS),
+    ('ALL', MATCH_ALL),
+]
+
+# (min_score, max_results)
+LIMITS = [(0, 0), (50, 0), (0, 20), (50, 20)]
+
+
+def profile_names(variant, count):
+    """Generate ``count`` VPN profile names of type ``variant``."""
+    random.seed(count)
+    names = []
+    for i in range(count):
+        country = random.choice(COUNTRIES)
+        proto = random.choice(PROTOCOLS)
+        if variant == 'ascii':
+            name = u'{} {} #{} ({})'.format(
+                country, random.choice(ASCII_CITIES), i, proto)
+        elif variant == 'diacritic':
+            name = u'{} {} #{} ({})'.format(
+                country, random.choice(ACCENTED_CITIES), i, proto)
+        else:
+            city = random.choice(ASCII_CITIES).lower().replace(u' ', u'_')
+            name = u'{}-{}.srv_{:03d}/{}:{}'.format(
+                country.lower(), city, i, proto.lower(),
+                random.choice([443, 1194, 1195]))
+
+        names.append(name)
+
+    return names
+
+
+def cases():
+    """Yield ``(name, kwargs)`` for each set of `filter` arguments."""
+    for label, rule in RULES:
+        yield 'match={}'.format(label), dict(match_on=rule)
+
+    for fold in (True, False):
+        yield 'fold={}'.format(fold), dict(fold_diacritics=fold)
+
+    for min_score, max_results in LIMITS:
+        yield ('min_score={},max_results={}'.format(min_score, max_results),
+               dict(min_score=min_score, max_results=max_results))
+
+
+def percentile(values, pc):
+    """Return ``pc``-th percentile of ``values`` (nearest rank)."""
+    values = sorted(values)
+    i = int(round(pc / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(i, len(values) - 1))]
+
+
+def run_case(wf, names, queries, kwargs, repeat):
+    """Return timings in milliseconds of ``repeat`` runs of a case."""
+    timings = []
+    for _ in range(repeat):
+        # Every keystroke is a new process in Alfred, so start cold
+        _fold_to_ascii.cache_clear()
+        start = timer()
+        for query in queries:
+            wf.filter(query, names, **kwargs)
+        timings.append((timer() - start) * 1000)
+
+    return timings
+
+
+def run(wf, sizes, repeat):
+    """Run all benchmarks and return results."""
+    results = {}
+    for size in sizes:
+        for variant in ('ascii', 'diacritic', 'delimiter'):
+            names = profile_names(variant, size)
+            queries = QUERIES[variant]
+            for case, kwargs in cases():
+                key = '{}/{}/{}'.format(variant, size, case)
+                timings = run_case(wf, names, queries, kwargs, repeat)
+                results[key] = dict(
+                    variant=variant, size=size, case=case,
+                    p50=percentile(timings, 50),
+                    p95=percentile(timings, 95),
+                )
+                print(u'{:<48s} p50={:9.2f} ms  p95={:9.2f} ms'.format(
+                      key, results[key]['p50'], results[key]['p95']))
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print and return keys of cases that regressed vs ``baseline``."""
+    regressed = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+
+        old, new = baseline[key]['p95'], results[key]['p95']
+        if new - old < MIN_REGRESSION_MS or new <= old * threshold:
+            continue
+
+        regressed.append(key)
+        print(u'REGRESSION {:<48s} p95 {:9.2f} -> {:9.2f} ms ({:.2f}x)'.format(
+              key, old, new, new / old if old else float('inf')))
+
+    return regressed
+
+
+def main():
+    """Run benchmark suite."""
+    args = docopt.docopt(__doc__)
+    sizes = [int(s) for s in args['<size>']] or DEFAULT_SIZES
+    repeat = int(args['--repeat'])
+    threshold = float(args['--threshold'])
+
+    # Keep benchmark settings and cache out of the real workflow directories
+    tempdir = tempfile.mkdtemp()
+    os.environ['alfred_workflow_data'] = tempdir
+    os.environ['alfred_workflow_cache'] = tempdir
+    try:
+        results = run(Workflow(), sizes, repeat)
+    finally:
+        shutil.rmtree(tempdir)
+
+    if args['--output']:
+        with open(args['--output'], 'wb') as fp:
+            json.dump(dict(python=platform.python_version(), repeat=repeat,
+                           results=results),
+                      fp, indent=2, sort_keys=True)
+
+    if args['--baseline']:
+        with open(args['--baseline']) as fp:
+            baseline = json.load(fp)['results']
+
+        if compare(results, baseline, threshold):
+            return 1
+
+        print(u'\nno regressions (threshold {:.2f}x)'.format(threshold))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
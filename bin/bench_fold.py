@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2026 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""bench_fold.py [<count>]
+
+Benchmark diacritic folding on profile names containing city names.
+
+Compares the old `fold_to_ascii` (per-character replacement plus NFKD
+normalisation) with the translate-table version, both with an empty
+and a warm cache, and times `Workflow.filter` for each keystroke of
+some queries. Every keystroke is a new process in Alfred, so the
+per-keystroke timings use an empty cache.
+
+Usage:
+    bench_fold.py [<count>]
+    bench_fold.py -h
+
+Options:
+    -h, --help  Show this message and exit.
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+import unicodedata
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+                   __file__))), 'src')
+sys.path.insert(0, SRC)
+
+from workflow import Workflow  # noqa: E402
+from workflow.workflow import (  # noqa: E402
+    ASCII_REPLACEMENTS,
+    _fold_to_ascii,
+    fold_to_ascii,
+    isascii,
+)
+
+COUNTRIES = [u'DE', u'AT', u'CH', u'FR', u'PL', u'CZ', u'SE', u'IS', u'TR']
+CITIES = [u'Zürich', u'München', u'Düsseldorf', u'Köln', u'Göteborg',
+          u'Malmö', u'Kraków', u'Łódź', u'Wrocław', u'Gdańsk', u'Brno',
+          u'České Budějovice', u'Reykjavík', u'Akureyri', u'İstanbul',
+          u'Besançon', u'Orléans', u'Saint-Étienne', u'Graz', u'Linz']
+QUERIES = [u'zurich', u'lodz', u'ceske', u'saint et']
+
+DEFAULT_COUNT = 10000
+
+
+def old_fold_to_ascii(text):
+    """Pre-1.38 implementation of `fold_to_ascii`."""
+    if isascii(text):
+        return text
+    text = u''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+    return unicode(unicodedata.normalize('NFKD',
+                   text).encode('ascii', 'ignore'))
+
+
+def profile_names(count):
+    """Generate ``count`` VPN profile names."""
+    random.seed(count)
+    names = []
+    for i in range(count):
+        names.append(u'{} {} #{} ({})'.format(
+            random.choice(COUNTRIES), random.choice(CITIES), i,
+            random.choice([u'UDP', u'TCP'])))
+
+    return names
+
+
+def timed(func, *args):
+    """Return duration of ``func(*args)`` in milliseconds."""
+    start = timer()
+    func(*args)
+    return (timer() - start) * 1000
+
+
+def bench_fold(names):
+    """Time folding all ``names`` with the old and new implementations."""
+    def fold_all(fold):
+        for name in names:
+            fold(name)
+
+    _fold_to_ascii.cache_clear()
+    results = [
+        ('old (join + NFKD)', timed(fold_all, old_fold_to_ascii)),
+        ('translate, empty cache', timed(fold_all, fold_to_ascii)),
+        ('translate, warm cache', timed(fold_all, fold_to_ascii)),
+    ]
+
+    print(u'\nfolding {:d} names'.format(len(names)))
+    for label, ms in results:
+        print(u'  {:<24s} {:8.1f} ms'.format(label, ms))
+
+
+def bench_keystrokes(wf, names):
+    """Time `Workflow.filter` for each keystroke of `QUERIES`."""
+    print(u'\nfilter per keystroke ({:d} names, empty cache)'.format(
+          len(names)))
+
+    for query in QUERIES:
+        total = 0.0
+        strokes = 0
+        for i in range(1, len(query) + 1):
+            _fold_to_ascii.cache_clear()
+            total += timed(wf.filter, query[:i], names)
+            strokes += 1
+
+        print(u'  {:<24s} {:8.1f} ms/keystroke'.format(query, total / strokes))
+
+
+def main():
+    """Run benchmarks."""
+    args = sys.argv[1:]
+    if '-h' in args or '--help' in args:
+        print(__doc__)
+        return 0
+
+    count = int(args[0]) if args else DEFAULT_COUNT
+    names = profile_names(count)
+
+    # Keep benchmark settings out of the real workflow directories
+    tempdir = tempfile.mkdtemp()
+    os.environ['alfred_workflow_data'] = tempdir
+    os.environ['alfred_workflow_cache'] = tempdir
+    try:
+        bench_fold(names)
+        bench_keystrokes(Workflow(), names)
+    finally:
+        shutil.rmtree(tempdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2026 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""bench_serializers.py [options] [<size>...]
+
+Benchmark the serializers registered with `workflow.manager`.
+
+Generates a list of <size> synthetic VPN connections (the namedtuples
+the workflow caches) for each <size>, then saves it to and loads it
+from a file with every registered serializer. Each case runs several
+times and the median dump and load times are reported, along with
+the size of the file and whether the loaded data equal the original.
+
+Usage:
+    bench_serializers.py [-r <n>] [-o <file>] [<size>...]
+    bench_serializers.py -h
+
+Options:
+    -r, --repeat <n>     Number of runs per case [default: 5].
+    -o, --output <file>  Save results to JSON file.
+    -h, --help           Show this message and exit.
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+                   __file__))), 'src')
+sys.path.insert(0, SRC)
+
+import docopt  # noqa: E402
+from workflow import manager  # noqa: E402
+
+# A typical user has a handful of connections. The larger sizes are
+# for providers that ship a profile per server.
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+# Same fields as `vpn.VPN`
+VPN = namedtuple('VPN', ['name', 'active', 'host', 'protocol'])
+
+COUNTRIES = [u'DE', u'AT', u'CH', u'FR', u'PL', u'CZ', u'SE', u'US', u'GB']
+CITIES = [u'Frankfurt', u'Zürich', u'München', u'Vienna', u'Paris',
+          u'Kraków', u'Prague', u'Malmö', u'New York', u'London']
+PROTOCOLS = [u'udp', u'tcp']
+
+
+def connections(count):
+    """Generate ``count`` VPN connections."""
+    random.seed(count)
+    conns = []
+    for i in range(count):
+        country = random.choice(COUNTRIES)
+        name = u'{} {} #{}'.format(country, random.choice(CITIES), i)
+        host = u'{}{}.vpn.example.com'.format(country.lower(), i)
+        conns.append(VPN(name, i == 0, host, random.choice(PROTOCOLS)))
+
+    return conns
+
+
+def median(values):
+    """Return median of ``values``."""
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def run_case(serializer, data, path, repeat):
+    """Return dump & load timings, file size and whether data survived."""
+    dumps, loads = [], []
+    for _ in range(repeat):
+        start = timer()
+        with open(path, 'wb') as fp:
+            serializer.dump(data, fp)
+        dumps.append((timer() - start) * 1000)
+
+        start = timer()
+        with open(path, 'rb') as fp:
+            loaded = serializer.load(fp)
+        loads.append((timer() - start) * 1000)
+
+    return dict(dump=median(dumps), load=median(loads),
+                bytes=os.path.getsize(path), equal=loaded == data)
+
+
+def run(dirpath, sizes, repeat):
+    """Run all benchmarks and return results."""
+    results = {}
+    print(u'{:<20s} {:>10s} {:>10s} {:>12s}  equal'.format(
+          u'case', u'dump ms', u'load ms', u'bytes'))
+    for size in sizes:
+        data = connections(size)
+        for name in manager.serializers:
+            key = '{}/{}'.format(name, size)
+            path = os.path.join(dirpath, key.replace('/', '.'))
+            results[key] = run_case(manager.serializer(name), data, path,
+                                    repeat)
+            results[key].update(serializer=name, size=size)
+            print(u'{:<20s} {:10.2f} {:10.2f} {:12d}  {}'.format(
+                  key, results[key]['dump'], results[key]['load'],
+                  results[key]['bytes'], results[key]['equal']))
+
+    return results
+
+
+def main():
+    """Run benchmark suite."""
+    args = docopt.docopt(__doc__)
+    sizes = [int(s) for s in args['<size>']] or DEFAULT_SIZES
+    repeat = int(args['--repeat'])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        results = run(tempdir, sizes, repeat)
+    finally:
+        shutil.rmtree(tempdir)
+
+    if args['--output']:
+        with open(args['--output'], 'wb') as fp:
+            json.dump(dict(python=platform.python_version(), repeat=repeat,
+                           results=results),
+                      fp, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
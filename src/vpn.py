@@ -28,6 +28,7 @@ from __future__ import print_function, absolute_import
 import abc
 from collections import namedtuple
 from contextlib import contextmanager
+from glob import glob
 import json
 import os
 from operator import attrgetter, itemgetter
@@ -35,7 +36,18 @@ import sys
 from time import time
 
 import docopt
-from workflow import Workflow3, ICON_WARNING, ICON_WEB
+from workflow import (
+    Workflow3,
+    ICON_WARNING,
+    ICON_WEB,
+    MATCH_ALL,
+    MATCH_ALLCHARS,
+    MATCH_ATOM,
+    MATCH_STARTSWITH,
+    MATCH_SUBSTRING,
+)
+from workflow.frecency import Frecency
+from workflow.index import BKTree, TrigramIndex
 from workflow.util import appinfo, run_command
 
 log = None
@@ -58,8 +70,42 @@ UPDATE_SETTINGS = {
     'github_slug': 'deanishe/alfred-viscosity'
 }
 
-# VPN configuration
-VPN = namedtuple('VPN', ['name', 'active'])
+# Use a search index if there are at least this many connections
+INDEX_THRESHOLD = 1000
+# Maximum number of connections to show. Alfred shows 9 by default, so
+# this is several screenfuls. Filtering stops when there are enough.
+MAX_RESULTS = 50
+# Score at most this many milliseconds if there are at least
+# DEADLINE_THRESHOLD connections
+DEADLINE_MS = 150
+DEADLINE_THRESHOLD = 10000
+# Records when connections are used, so they can be ranked higher
+USAGE_FILE = 'usage.frecency'
+# Connections are re-fetched in the background when the cached list
+# is older than this many seconds (and after connecting or
+# disconnecting), so connection states stay current. Fetching them
+# runs osascript, so not too often.
+CONNECTIONS_SOFT_TTL = 60
+# Maximum size of the cache directory. Cached indices and data of old
+# Alfred sessions are deleted (least recently used first) above this.
+CACHE_MAX_BYTES = 10 * 1024 * 1024
+
+# Qualifiers understood in `list` queries, e.g. "is:active"
+QUALIFIERS = ('app', 'is', 'tag')
+# Values of the "is" qualifier
+STATES = ('active', 'idle')
+
+# Connection attributes to search: (attribute, weight, match_on)
+SEARCH_FIELDS = [
+    ('name', 1.0, MATCH_ALL),
+    ('host', 0.9, MATCH_STARTSWITH | MATCH_ATOM | MATCH_SUBSTRING),
+    ('protocol', 0.5, MATCH_STARTSWITH),
+]
+
+# VPN configuration. `host` and `protocol` are read from the OpenVPN
+# config files and are empty if they can't be found.
+VPN = namedtuple('VPN', ['name', 'active', 'host', 'protocol'])
+VPN.__new__.__defaults__ = ('', '')
 
 
 # dP                dP
@@ -76,6 +122,60 @@ class NotInstalled(Exception):
     """Raised if an application is not installed."""
 
 
+def parse_query(query):
+    """Split query into free text and qualifiers.
+
+    Qualifiers are words like ``is:active`` whose prefix is in
+    `QUALIFIERS`. Qualifiers without a value and ``is`` qualifiers
+    whose value isn't in `STATES` are ignored, as the user is probably
+    still typing them.
+
+    Returns ``(text, qualifiers)``, where ``qualifiers`` is a dict
+    mapping each qualifier to a list of lower-case values.
+    """
+    words = []
+    qualifiers = {}
+    for word in query.split():
+        key, sep, value = word.partition(':')
+        key = key.lower()
+        value = value.lower()
+        if not sep or key not in QUALIFIERS:
+            words.append(word)
+        elif value and (key != 'is' or value in STATES):
+            qualifiers.setdefault(key, []).append(value)
+
+    return ' '.join(words), qualifiers
+
+
+def read_openvpn_config(path):
+    """Return ``(name, host, protocol)`` from OpenVPN config file.
+
+    ``name`` is only set in Viscosity's config files. Bytes that
+    aren't UTF-8 (e.g. in Latin-1 comments) are replaced.
+    """
+    name = host = protocol = remote_protocol = ''
+    with open(path) as fp:
+        for line in fp:
+            words = wf.decode(line.decode('utf-8', 'replace')).split()
+            if len(words) < 2:
+                continue
+
+            if words[:2] == ['#viscosity', 'name']:
+                name = ' '.join(words[2:])
+            # Use the first remote if there are several
+            elif words[0] == 'remote' and not host:
+                host = words[1]
+                if len(words) > 3:
+                    remote_protocol = words[3]
+            elif words[0] == 'proto':
+                protocol = words[1]
+
+    # A remote's protocol overrides the default. Protocols may
+    # be e.g. "udp4" or "tcp-client".
+    protocol = (remote_protocol or protocol)[:3].upper()
+    return name, host, protocol
+
+
 @contextmanager
 def timed(name=None):
     """Context manager that logs execution time."""
@@ -100,6 +200,7 @@ class VPNApp(object):
     def __init__(self):
         """Create new initialised `VPNApp`."""
         self._info = False
+        self._connections = None
 
     @abc.abstractproperty
     def program(self):
@@ -110,19 +211,108 @@ class VPNApp(object):
         """URL to get application."""
         return
 
-    @abc.abstractproperty
+    @abc.abstractmethod
+    def _fetch_connections(self):
+        """Get list of `VPN` connections from application."""
+
+    @property
     def connections(self):
-        """All VPN connections."""
-        return
+        """All VPN connections.
+
+        A `RecordTable` from the cache. The same table is returned for
+        the whole run, so the indices built from it match it, even if
+        a background refresh replaces the cached connections.
+        """
+        if self._connections is None:
+            self._connections = wf.cached(self.name.lower() + '-connections')
+        return self._connections
+
+    def _derived(self, suffix, build):
+        """Return data built from `connections` by ``build``.
+
+        The data are cached with the digest of the connections they
+        were built from, and rebuilt if the connections have changed,
+        so the positions in them always match `connections`.
+        """
+        connections = self.connections
+        key = self.name.lower() + suffix
+        digest, data = wf.cached_data(
+            key, lambda: (connections.digest, build(connections)),
+            max_age=0, session=True)
+        if digest != connections.digest:
+            data = build(connections)
+            wf.cache_data(key, (connections.digest, data), session=True)
+
+        return data
 
     @property
     def info(self):
         """Return application info or `None` if not installed."""
         if self._info is False:
-            self._info = appinfo(self.name)
+            # Looking up the app with Spotlight is slow
+            self._info = wf.cached_data(self.name.lower() + '-appinfo',
+                                        lambda: appinfo(self.name),
+                                        max_age=0, session=True)
             log.debug('[%s] appinfo=%r', self.name, self._info)
         return self._info
 
+    @property
+    def index(self):
+        """Search indices of connections' `SEARCH_FIELDS`."""
+        def _build(connections):
+            with timed('indexed {} connections'.format(self.name)):
+                # The table's digest lets `filter` trust the indices
+                # without reading every connection
+                return [TrigramIndex([getattr(c, attr) for c in connections],
+                                     digest=connections.digest)
+                        for attr, _, _ in SEARCH_FIELDS]
+
+        return self._derived('-field-index', _build)
+
+    @property
+    def typo_index(self):
+        """BK-tree of connection names for typo-tolerant search."""
+        def _build(connections):
+            with timed('built {} BK-tree'.format(self.name)):
+                return BKTree([c.name for c in connections])
+
+        return self._derived('-bktree', _build)
+
+    @property
+    def predicate_index(self):
+        """Positions of connections by qualifier & value.
+
+        A dict mapping ``'is'`` to a dict of states and positions.
+        Tags are looked up with `tag_positions`.
+        """
+        def _build(connections):
+            index = {'is': {}}
+            for i, c in enumerate(connections):
+                state = 'active' if c.active else 'idle'
+                index['is'].setdefault(state, []).append(i)
+
+            return index
+
+        return self._derived('-predicate-index', _build)
+
+    def tag_positions(self, tag):
+        """Return positions of connections tagged ``tag``.
+
+        Tags are read from the ``tags`` setting, which maps tags to
+        connection names, so changes apply immediately.
+        """
+        names = []
+        for key, value in wf.settings.get('tags', {}).items():
+            if key.lower() == tag:
+                names.extend(value)
+
+        if not names:
+            return []
+
+        positions = self._derived('-positions', lambda connections: {
+            c.name: i for i, c in enumerate(connections)})
+        return sorted(positions[n] for n in names if n in positions)
+
     @property
     def installed(self):
         """Return `True` if application is installed."""
@@ -162,6 +352,10 @@ class VPNApp(object):
         for c in connections:
             self.disconnect(c.name)
 
+    def metadata(self):
+        """Return mapping of connection names to ``(host, protocol)``."""
+        return {}
+
     def filter_connections(self, name=None, active=True):
         """Return connections with matching name and state."""
         connections = self.connections
@@ -189,13 +383,6 @@ class Viscosity(VPNApp):
         """URL to get application."""
         return 'https://www.sparklabs.com/viscosity/'
 
-    @property
-    def connections(self):
-        """All Viscosity VPN connections."""
-        return wf.cached_data('viscosity-connections',
-                              self._fetch_connections,
-                              max_age=0, session=True)
-
     def _fetch_connections(self):
         """Get configurations from VPN app."""
         connections = []
@@ -203,12 +390,31 @@ class Viscosity(VPNApp):
             cmd = self.program + ['list']
 
             data = json.loads(run_command(cmd))
+            meta = self.metadata()
 
-            for t in data.items():
-                connections.append(VPN(*t))
+            for name, active in data.items():
+                connections.append(VPN(name, active,
+                                       *meta.get(name, ('', ''))))
 
         return connections
 
+    def metadata(self):
+        """Read hosts & protocols from Viscosity's config files."""
+        meta = {}
+        pat = os.path.expanduser('~/Library/Application Support/Viscosity/'
+                                 'OpenVPN/*/config.conf')
+        for path in glob(pat):
+            try:
+                name, host, protocol = read_openvpn_config(path)
+            except (IOError, OSError) as err:
+                log.warning('could not read %s: %s', path, err)
+                continue
+
+            if name:
+                meta[name] = (host, protocol)
+
+        return meta
+
 
 class Tunnelblick(VPNApp):
     """Interface to Tunnelblick.app."""
@@ -224,13 +430,6 @@ class Tunnelblick(VPNApp):
         """URL to get application."""
         return 'https://tunnelblick.net'
 
-    @property
-    def connections(self):
-        """All Tunnelblick VPN connections."""
-        return wf.cached_data('tunnelblick-connections',
-                              self._fetch_connections,
-                              max_age=0, session=True)
-
     def _fetch_connections(self):
         """Get configurations from VPN app."""
         connections = []
@@ -238,23 +437,64 @@ class Tunnelblick(VPNApp):
             cmd = self.program + ['list']
 
             output = wf.decode(run_command(cmd)).strip()
+            meta = self.metadata()
 
             for line in output.split('\n'):
                 active = True if line[0] == '1' else False
                 name = line[2:]
-                connections.append(VPN(name, active))
+                connections.append(VPN(name, active,
+                                       *meta.get(name, ('', ''))))
 
         return connections
 
+    def metadata(self):
+        """Read hosts & protocols from Tunnelblick's config files."""
+        meta = {}
+        for root in ('~/Library/Application Support/Tunnelblick/'
+                     'Configurations',
+                     '/Library/Application Support/Tunnelblick/Shared'):
+            pat = os.path.join(os.path.expanduser(root),
+                               '*.tblk/Contents/Resources/config.ovpn')
+            for path in glob(pat):
+                # Connection is named after its .tblk bundle
+                name = wf.decode(os.path.basename(
+                    path[:-len('/Contents/Resources/config.ovpn')]))[:-5]
+                try:
+                    _, host, protocol = read_openvpn_config(path)
+                except (IOError, OSError) as err:
+                    log.warning('could not read %s: %s', path, err)
+                    continue
+
+                meta[name] = (host, protocol)
+
+        return meta
+
     def disconnect_all(self):
         """Close all active VPNs."""
         cmd = self.program + ['disconnect-all']
         run_command(cmd)
 
 
-def get_app():
-    """Return application object for currently-selected app."""
-    name = os.getenv('VPN_APP') or 'Viscosity'
+def get_usage():
+    """Return store of connection usage."""
+    return Frecency(wf.datafile(USAGE_FILE))
+
+
+def get_app(name=None):
+    """Return application object for currently-selected app.
+
+    If ``name`` is given, return the app whose name starts with it
+    (case-insensitive) instead.
+    """
+    if name:
+        prefix = name.lower()
+        name = ''
+        for cls in VPNApp.__subclasses__():
+            if cls.__name__.lower().startswith(prefix):
+                name = cls.__name__
+                break
+    else:
+        name = os.getenv('VPN_APP') or 'Viscosity'
 
     for cls in VPNApp.__subclasses__():
         if cls.__name__ == name:
@@ -278,6 +518,47 @@ def get_all_apps():
     return apps
 
 
+def register_cache_policies():
+    """Declare how each app's connections are cached.
+
+    Connections are cached for the session and refreshed in the
+    background after `CONNECTIONS_SOFT_TTL`. The indices built from
+    them are deleted when a refresh changes the connections (and
+    rebuilt anyway if they don't match, see `VPNApp._derived`).
+    """
+    for app in get_all_apps():
+        name = app.name.lower()
+        wf.register_cache_policy(
+            name + '-connections', app._fetch_connections,
+            ttl=0, soft_ttl=CONNECTIONS_SOFT_TTL, session=True, records=True,
+            invalidates=[name + '-field-index', name + '-bktree',
+                         name + '-predicate-index', name + '-positions'])
+
+
+def warm_caches(wf):
+    """Fill the caches `do_list` needs, so the first search is fast.
+
+    Called in the background by `Workflow.run` after the workflow is
+    installed or updated or a run had to fetch connections (e.g. the
+    first of a session), and by background refreshes of connections
+    after they delete the indices. (`run` also starts the update check,
+    so its status needn't be fetched here.)
+
+    Connections are cached per session, so the first search of
+    a session still fetches them itself; this fills the other apps'
+    caches and the indices while the user types.
+    """
+    with timed('warmed caches'):
+        for app in get_all_apps():
+            if not app.installed:
+                continue
+
+            connections = app.connections
+            app.predicate_index
+            if len(connections) >= INDEX_THRESHOLD:
+                app.index
+
+
 #                            .8888b oo
 #                            88   "
 # .d8888b. .d8888b. 88d888b. 88aaa  dP .d8888b.
@@ -399,10 +680,48 @@ def do_config(query):
 # 88.  ... 88.  .88 88    88 88    88 88.  ... 88.  ...   88
 # `88888P' `88888P' dP    dP dP    dP `88888P' `88888P'   dP
 
+def select_connections(app, qualifiers):
+    """Return positions of connections that match ``qualifiers``.
+
+    Returns ``None`` if they don't narrow down the connections.
+    """
+    positions = None
+
+    # Values of the same qualifier are alternatives (union), different
+    # qualifiers must all match (intersection)
+    selected = []
+    tags = qualifiers.get('tag', [])
+    if tags:
+        selected.append(set(i for tag in tags
+                            for i in app.tag_positions(tag)))
+
+    # Idle connections are shown by default and active ones are
+    # skipped when they're displayed, so only narrow down by state if
+    # active connections are wanted
+    states = qualifiers.get('is', [])
+    if 'active' in states:
+        index = app.predicate_index['is']
+        selected.append(set(i for state in states
+                            for i in index.get(state, [])))
+
+    for hits in selected:
+        if positions is None:
+            positions = set(hits)
+        else:
+            positions.intersection_update(hits)
+
+    if positions is None:
+        return None
+
+    return sorted(positions)
+
+
 def do_list(query):
     """Show/filter list of VPN connections."""
+    query, qualifiers = parse_query(query or '')
+    apps = qualifiers.get('app', [])
     try:
-        app = get_app()
+        app = get_app(apps[-1] if apps else None)
     except NotInstalled as err:
         wf.add_item(err.message,
                     'Use "vpnconf" to change the application',
@@ -410,10 +729,26 @@ def do_list(query):
                     icon=ICON_WARNING)
         wf.send_feedback()
         return
+    except ValueError:
+        wf.add_item('Unknown Application',
+                    'Try "app:viscosity" or "app:tunnelblick"',
+                    valid=False,
+                    icon=ICON_WARNING)
+        wf.send_feedback()
+        return
 
-    connections = app.connections
+    # `do_connect` and `do_disconnect` use the configured app, so
+    # tell them which one to use if `app:` selected another
+    def setvars(it, action):
+        it.setvar('action', action)
+        if app.name != (os.getenv('VPN_APP') or 'Viscosity'):
+            it.setvar('VPN_APP', app.name)
 
-    active_connections = [c for c in connections if c.active]
+    # Connections are only read from the cache when they're accessed,
+    # so look up active ones in the index instead of checking them all
+    connections = app.connections
+    active_connections = [connections[i] for i in
+                          app.predicate_index['is'].get('active', [])]
 
     if len(active_connections) > 0:
         connected = True
@@ -423,7 +758,7 @@ def do_list(query):
     # ---------------------------------------------------------
     # Display active connections at the top if there's no query
     nouids = False
-    if not query:
+    if not query and not qualifiers:
 
         nouids = show_update()
 
@@ -435,7 +770,7 @@ def do_list(query):
                 valid=True,
                 icon=ICON_CONNECTED,
             )
-            it.setvar('action', 'disconnect')
+            setvars(it, 'disconnect')
 
         for con in active_connections:
             it = wf.add_item(
@@ -445,41 +780,135 @@ def do_list(query):
                 valid=True,
                 icon=ICON_CONNECTED,
             )
-            it.setvar('action', 'disconnect')
+            setvars(it, 'disconnect')
 
     # ---------------------------------------------------------
-    # Filter inactive connections
-    if query:
-        with timed('filtered connections'):
-            connections = wf.filter(query, connections, attrgetter('name'),
-                                    min_score=30)
+    # Narrow down connections by qualifiers
+    states = qualifiers.get('is', [])
+    show_active = 'active' in states
+    show_idle = 'idle' in states or not show_active
 
-    if not connections:
-        wf.add_item('No Matching Connections', 'Try a different query?',
-                    icon=ICON_WARNING)
+    positions = select_connections(app, qualifiers)
+    if positions is not None:
+        connections = [connections[i] for i in positions]
 
     # ---------------------------------------------------------
-    # Display inactive connections
-    for con in connections:
-        if con.active:
-            continue
-
-        # Only add UID if there are no connected VPNs
-        # to ensure connected VPNs are shown first
-        if connected or nouids:
-            uid = None
+    # Filter inactive connections, most-used first
+    usage = get_usage()
+    if not query:
+        connections = sorted(connections,
+                             key=lambda c: -usage.score(c.name))
+    else:
+        # Use a search index for long lists. MATCH_ALLCHARS can't be
+        # indexed, but its matches rarely beat `min_score` anyway.
+        # The index only fits the full list.
+        index = None
+        fields = [(attrgetter(attr), weight, match_on)
+                  for attr, weight, match_on in SEARCH_FIELDS]
+        if len(connections) >= INDEX_THRESHOLD:
+            if positions is None:
+                index = app.index
+            fields = [(key, weight, match_on & ~MATCH_ALLCHARS)
+                      for key, weight, match_on in fields]
+
+        def weight(c):
+            return usage.weight(c.name)
+
+        if len(connections) >= DEADLINE_THRESHOLD:
+            # Stop scoring very long lists when time's up. The rest
+            # are scored in a process pool if that's quicker, otherwise
+            # Alfred runs the workflow again to score them.
+            connections = wf.filter(
+                query, connections, min_score=30,
+                max_results=MAX_RESULTS + len(active_connections),
+                fields=fields, index=index, weight=weight,
+                deadline_ms=DEADLINE_MS)
         else:
-            uid = con.name
-
-        it = wf.add_item(
-            con.name,
-            u'↩ to connect',
-            uid=uid,
-            arg=con.name,
-            valid=True,
-            icon=ICON_DISCONNECTED,
-        )
-        it.setvar('action', 'connect')
+            # Generate matches best rule first. All are scored in one
+            # pass (in a process pool if that's quicker), but only the
+            # buckets of the rules that are shown before MAX_RESULTS is
+            # reached are sorted.
+            connections = wf.ifilter(query, connections, min_score=30,
+                                     fields=fields, index=index,
+                                     weight=weight)
+
+    # ---------------------------------------------------------
+    # Display inactive connections (and active ones if requested)
+    shown = 0
+    with timed('filtered connections'):
+        for con in connections:
+            if con.active:
+                if show_active:
+                    it = wf.add_item(
+                        con.name,
+                        u'↩ to disconnect',
+                        arg=con.name,
+                        valid=True,
+                        icon=ICON_CONNECTED,
+                    )
+                    setvars(it, 'disconnect')
+                    shown += 1
+                continue
+
+            if not show_idle:
+                continue
+
+            # Only add UID if there are no connected VPNs
+            # to ensure connected VPNs are shown first
+            if connected or nouids:
+                uid = None
+            else:
+                uid = con.name
+
+            it = wf.add_item(
+                con.name,
+                u'↩ to connect',
+                uid=uid,
+                arg=con.name,
+                valid=True,
+                icon=ICON_DISCONNECTED,
+            )
+            setvars(it, 'connect')
+
+            shown += 1
+            if shown == MAX_RESULTS:
+                break
+
+    # ---------------------------------------------------------
+    # Look for typos if no matches are shown (hidden active
+    # connections may have matched)
+    if query and not shown:
+        with timed('typo search'):
+            hits = app.typo_index.candidates(query)
+
+        # Indices are into the unfiltered list of connections
+        connections = app.connections
+        if positions is not None:
+            positions = set(positions)
+
+        for _, i in hits:
+            con = connections[i]
+            if con.active or not show_idle:
+                continue
+            if positions is not None and i not in positions:
+                continue
+
+            shown += 1
+            it = wf.add_item(
+                con.name,
+                u'↩ to connect (did you mean this?)',
+                arg=con.name,
+                valid=True,
+                icon=ICON_DISCONNECTED,
+            )
+            setvars(it, 'connect')
+
+            if shown == MAX_RESULTS:
+                break
+
+    if not shown:
+        wf.add_item('No Matching Connections', 'Try a different query?',
+                    icon=ICON_WARNING)
 
     wf.send_feedback()
 
@@ -488,12 +917,16 @@ def do_connect(name):
     """Connect to specified VPN(s)."""
     app = get_app()
     app.connect(name)
+    wf.refresh_cache(app.name.lower() + '-connections')
+    if name and not get_usage().record(name):
+        log.warning(u'usage store is locked, not recording "%s"', name)
 
 
 def do_disconnect(name):
     """Disconnect specified VPN(s)."""
     app = get_app()
     app.disconnect(name)
+    wf.refresh_cache(app.name.lower() + '-connections')
 
 
 def do_app(name):
@@ -535,5 +968,15 @@ def main(wf):
 
 if __name__ == '__main__':
     wf = Workflow3(update_settings=UPDATE_SETTINGS)
+    # Keep cached data in one database instead of a file per session
+    wf.cache_backend = 'sqlite'
+    wf.cache_max_bytes = CACHE_MAX_BYTES
+    # Pickled `VPN` tuples etc. may change between versions, so each
+    # version has its own caches. Older versions' are deleted lazily.
+    wf.cache_namespace = str(wf.version)
+    register_cache_policies()
+    # See how often connections are fetched with "workflow:cachestats"
+    wf.record_cache_stats = True
+    wf.cache_warmer = warm_caches
     log = wf.logger
     sys.exit(wf.run(main))
@@ -0,0 +1,729 @@
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Storage backends for :meth:`Workflow.cached_data() <workflow.Workflow.cached_data>`.
+
+.. versionadded:: 1.38
+
+By default, each cache key is saved to its own file in the workflow's
+cache directory (:class:`FileCache`). :class:`SQLiteCache` keeps all
+keys in a single, indexed SQLite database instead, which means fewer
+files and system calls per lookup, and writes are transactional.
+
+Choose a backend by name (see :data:`BACKENDS`) or pass an instance::
+
+    wf = Workflow3()
+    wf.cache_backend = 'sqlite'
+
+A backend stores serialized data under a ``(name, serializer)`` key,
+where ``serializer`` is the name of a serializer registered with
+:data:`~workflow.workflow.manager`, and must implement the methods of
+:class:`FileCache`.
+
+Data can be compressed with :mod:`zlib` by passing a ``compression``
+level to :meth:`~FileCache.save` (or :meth:`Workflow.cache_data()
+<workflow.Workflow.cache_data>`). Compressed data start with a tag,
+so :meth:`~FileCache.load` recognises and decompresses them, whatever
+the level.
+
+Records saved with :meth:`Workflow.cached_records()
+<workflow.Workflow.cached_records>` are the exception: they are
+always saved to ``<name>.records`` files in the cache directory,
+whatever the backend, because they are memory-mapped, which only
+works with files. :func:`evict` and :meth:`Workflow.clear_cache()
+<workflow.Workflow.clear_cache>` treat them as ordinary files.
+
+Saving data identical to the data already cached only updates the
+key's modification time, so refreshing unchanged data doesn't
+rewrite it.
+
+Backends record when each key was last read, so :func:`evict` can
+keep the cache directory under a size budget by deleting the least
+recently used data first. Run it via :meth:`Workflow.check_cache_size()
+<workflow.Workflow.check_cache_size>`, which does so in the background.
+
+If :attr:`Workflow.cache_namespace
+<workflow.Workflow.cache_namespace>` is set, keys are saved as
+``<name>@<namespace>``, and :func:`collect` deletes the data of other
+namespaces, e.g. in a format an older version of the workflow used.
+
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+from cStringIO import StringIO
+import hashlib
+import os
+import sqlite3
+import struct
+import time
+import zlib
+
+from util import write_if_changed
+
+# Last-access times are only updated if they are older than this
+# many seconds, so reading a key doesn't always mean a write, too
+ACCESS_RESOLUTION = 60
+
+# Data accessed in the last this-many seconds is never evicted.
+# It may be in use, e.g. the arguments of a background job that
+# hasn't started yet.
+EVICT_MIN_AGE = 60
+
+# Cache files that belong to the workflow, not to the cached data
+PROTECTED_SUFFIXES = ('.pid', '.lock', '.log', '.log.1')
+
+# Separates the name of a key from its namespace
+NAMESPACE_SEPARATOR = '@'
+
+# Marks zlib-compressed data. Followed by the compression level.
+COMPRESSION_TAG = b'\x00AWZ'
+COMPRESSION_HEADER = struct.Struct(b'>4sB')
+
+# Bytes read from compressed files at a time
+COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+#: Data that may be evicted from the cache. ``key`` is ``<name>.<serializer>``
+#: for backend keys or the filename for other files, ``size`` is in bytes
+#: and ``accessed`` is the time the data was last read or written.
+CacheEntry = namedtuple('CacheEntry', ['key', 'size', 'accessed'])
+
+
+def decompress(file_obj):
+    """Decompress zlib stream from ``file_obj`` chunk by chunk.
+
+    .. versionadded:: 1.38
+
+    The compressed data are never read all at once, but the
+    decompressed data are buffered: serializers make many small
+    reads, and reading them from an in-memory file is several times
+    faster than decompressing on demand.
+
+    :param file_obj: file handle positioned at start of zlib data
+    :type file_obj: ``file`` object
+    :returns: decompressed data
+    :rtype: ``cStringIO.StringIO``
+
+    """
+    d = zlib.decompressobj()
+    buf = StringIO()
+    while True:
+        data = file_obj.read(COMPRESSION_CHUNK_SIZE)
+        if not data:
+            break
+        buf.write(d.decompress(data))
+
+    buf.write(d.flush())
+    buf.seek(0)
+    return buf
+
+
+class ZlibWriter(object):
+    """Compress data as it's written.
+
+    .. versionadded:: 1.38
+
+    Call :meth:`close` to write the end of the stream.
+
+    :param file_obj: file handle to write compressed data to
+    :type file_obj: ``file`` object
+    :param level: zlib compression level (1-9)
+    :type level: ``int``
+
+    """
+
+    def __init__(self, file_obj, level):
+        """Create new :class:`ZlibWriter`."""
+        self._fp = file_obj
+        self._zlib = zlib.compressobj(level)
+
+    def write(self, data):
+        """Compress and write ``data``."""
+        self._fp.write(self._zlib.compress(data))
+
+    def close(self):
+        """Write the rest of the compressed stream."""
+        self._fp.write(self._zlib.flush())
+
+
+def dump_data(serializer, obj, file_obj, compression=0):
+    """Serialize ``obj`` to ``file_obj``, compressing it if requested.
+
+    .. versionadded:: 1.38
+
+    :param serializer: serializer object
+    :type serializer: object with ``dump()`` method
+    :param obj: data to serialize
+    :type obj: ``object``
+    :param file_obj: file handle
+    :type file_obj: ``file`` object
+    :param compression: zlib compression level (1-9) or ``0`` for
+        none
+    :type compression: ``int``
+
+    """
+    if not compression:
+        serializer.dump(obj, file_obj)
+        return
+
+    file_obj.write(COMPRESSION_HEADER.pack(COMPRESSION_TAG, compression))
+    writer = ZlibWriter(file_obj, compression)
+    serializer.dump(obj, writer)
+    writer.close()
+
+
+def load_data(serializer, file_obj):
+    """Load data saved by :func:`dump_data`, compressed or not.
+
+    .. versionadded:: 1.38
+
+    :param serializer: serializer object
+    :type serializer: object with ``load()`` method
+    :param file_obj: file handle. Must be seekable.
+    :type file_obj: ``file`` object
+    :returns: deserialized data
+    :rtype: ``object``
+
+    """
+    header = file_obj.read(COMPRESSION_HEADER.size)
+    if header[:len(COMPRESSION_TAG)] == COMPRESSION_TAG:
+        return serializer.load(decompress(file_obj))
+
+    file_obj.seek(0)
+    return serializer.load(file_obj)
+
+
+class FileCache(object):
+    """Save each key to its own file.
+
+    .. versionadded:: 1.38
+
+    This is how :meth:`~workflow.Workflow.cache_data` has always saved
+    data: to ``<name>.<serializer>`` files in the cache directory.
+
+    :param dirpath: directory to save files in
+    :type dirpath: ``unicode``
+    :param manager: registry of serializers
+    :type manager: :class:`~workflow.workflow.SerializerManager`
+
+    """
+
+    def __init__(self, dirpath, manager):
+        """Create new :class:`FileCache`."""
+        self.dirpath = dirpath
+        self.manager = manager
+
+    def path(self, name, serializer):
+        """Return path of cache file for ``name``."""
+        return os.path.join(self.dirpath, '%s.%s' % (name, serializer))
+
+    def load(self, name, serializer, max_age=0):
+        """Return data cached under ``name``.
+
+        :param name: cache key
+        :type name: ``unicode``
+        :param serializer: name of serializer data was saved with
+        :type serializer: ``unicode``
+        :param max_age: ignore data older than this many seconds.
+            ``0`` means no limit.
+        :type max_age: ``int``
+        :returns: cached data or ``None`` if it doesn't exist or
+            is too old
+        :rtype: ``object``
+
+        """
+        return self.load_with_age(name, serializer, max_age)[0]
+
+    def load_with_age(self, name, serializer, max_age=0):
+        """Return data cached under ``name`` and their age.
+
+        Like :meth:`load`, but saves a call to :meth:`age`.
+
+        :returns: ``(data, age)`` or ``(None, 0)`` if there are
+            no (fresh) data
+        :rtype: ``tuple``
+
+        """
+        path = self.path(name, serializer)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, 0
+
+        now = time.time()
+        age = now - st.st_mtime
+        if max_age and age >= max_age:
+            return None, 0
+
+        with open(path, 'rb') as fp:
+            data = load_data(self.manager.serializer(serializer), fp)
+
+        # Record access for `evict()`. Keep mtime, as that's the age.
+        if now - st.st_atime > ACCESS_RESOLUTION:
+            os.utime(path, (now, st.st_mtime))
+
+        return data, age
+
+    def save(self, name, serializer, data, compression=0):
+        """Save ``data`` under ``name``. Delete it if ``data`` is ``None``.
+
+        :param name: cache key
+        :type name: ``unicode``
+        :param serializer: name of serializer to save data with
+        :type serializer: ``unicode``
+        :param data: data to cache
+        :type data: ``object``
+        :param compression: zlib compression level (1-9) or ``0``
+            for none
+        :type compression: ``int``
+        :returns: ``False`` if the cached data were the same as
+            ``data`` and weren't rewritten, else ``True``
+        :rtype: ``bool``
+
+        """
+        path = self.path(name, serializer)
+        if data is None:
+            if os.path.exists(path):
+                os.unlink(path)
+            return True
+
+        # The file is its own checksum, so no hash is stored
+        fp = StringIO()
+        dump_data(self.manager.serializer(serializer), data, fp, compression)
+        return write_if_changed(path, fp.getvalue())
+
+    def age(self, name, serializer):
+        """Return age of ``name`` in seconds or ``0`` if it doesn't exist.
+
+        :param name: cache key
+        :type name: ``unicode``
+        :param serializer: name of serializer data was saved with
+        :type serializer: ``unicode``
+        :rtype: ``float``
+
+        """
+        try:
+            return time.time() - os.stat(self.path(name, serializer)).st_mtime
+        except OSError:
+            return 0
+
+    def clear(self, filter_func=lambda f: True):
+        """Delete cached data.
+
+        The cache files are deleted by :meth:`Workflow.clear_cache()
+        <workflow.Workflow.clear_cache>` along with the directory's
+        other files, so there's nothing else to do.
+
+        :param filter_func: called with ``<name>.<serializer>`` of
+            each key. Only keys it returns ``True`` for are deleted.
+        :type filter_func: ``callable``
+
+        """
+
+    def close(self):
+        """Release resources held by the backend.
+
+        Called before the files in ``dirpath`` are deleted. Each key
+        has its own file, so there's nothing to close.
+
+        """
+
+    def files(self):
+        """Return names of files in ``dirpath`` that belong to the backend.
+
+        :func:`evict` leaves these alone and uses :meth:`entries`
+        instead. Cache files are ordinary files to :func:`evict`,
+        so there are none.
+
+        :returns: filenames
+        :rtype: ``list``
+
+        """
+        return []
+
+    def entries(self):
+        """Return data stored outside of ordinary files.
+
+        :returns: list of :class:`CacheEntry` tuples
+        :rtype: ``list``
+
+        """
+        return []
+
+    def evict(self, keys):
+        """Delete data returned by :meth:`entries`.
+
+        :param keys: ``key`` of each :class:`CacheEntry` to delete
+        :type keys: ``list``
+
+        """
+
+
+class SQLiteCache(FileCache):
+    """Save all keys in one SQLite database.
+
+    .. versionadded:: 1.38
+
+    Keys are stored in a ``cache.sqlite`` file in ``dirpath`` with the
+    name of their serializer and the time they were saved, so loading
+    a key is a single indexed read, and expired data is never read.
+
+    The database uses SQLite's write-ahead log, so processes (Alfred
+    may run several Script Filters at the same time) can read while
+    another is writing.
+
+    :param dirpath: directory to save database in
+    :type dirpath: ``unicode``
+    :param manager: registry of serializers
+    :type manager: :class:`~workflow.workflow.SerializerManager`
+
+    """
+
+    #: Name of database file
+    filename = 'cache.sqlite'
+    #: Seconds to wait for another process's write to finish
+    timeout = 2.0
+    #: Version of the table layout. The cache is emptied if the
+    #: database was created with a different version.
+    schema_version = 3
+
+    def __init__(self, dirpath, manager):
+        """Create new :class:`SQLiteCache`."""
+        super(SQLiteCache, self).__init__(dirpath, manager)
+        self.dbpath = os.path.join(dirpath, self.filename)
+        self._conn = None
+
+    def _connect(self):
+        """Return connection to database, creating it if necessary."""
+        # Reconnect if database has been deleted, e.g. by
+        # `Workflow.clear_cache()`
+        if self._conn is not None and os.path.exists(self.dbpath):
+            return self._conn
+
+        self.close()
+        conn = sqlite3.connect(self.dbpath, timeout=self.timeout)
+        # Only takes effect in a new, empty database, so must come
+        # before the other pragmas. See `evict()`. Not set otherwise,
+        # as it waits for other processes' writes.
+        if not conn.execute('PRAGMA page_count').fetchone()[0]:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.schema_version:
+            with conn:
+                # Table is from an older version. New databases
+                # have version 0.
+                if version:
+                    conn.execute('DROP TABLE IF EXISTS cache')
+                # Other processes may be creating the table, too
+                conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                             'name TEXT NOT NULL, '
+                             'serializer TEXT NOT NULL, '
+                             'modified REAL NOT NULL, '
+                             'accessed REAL NOT NULL, '
+                             'hash TEXT NOT NULL, '
+                             'data BLOB NOT NULL, '
+                             'PRIMARY KEY (name, serializer))')
+                conn.execute('PRAGMA user_version = %d' % self.schema_version)
+
+        self._conn = conn
+        return conn
+
+    def close(self):
+        """Close connection to database. See :meth:`FileCache.close`."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def load_with_age(self, name, serializer, max_age=0):
+        """Return data and age. See :meth:`FileCache.load_with_age`."""
+        now = time.time()
+        sql = ('SELECT data, accessed, modified FROM cache '
+               'WHERE name = ? AND serializer = ?')
+        args = [name, serializer]
+        if max_age:
+            sql += ' AND modified > ?'
+            args.append(now - max_age)
+
+        conn = self._connect()
+        row = conn.execute(sql, args).fetchone()
+
+        if row is None:
+            return None, 0
+
+        data = load_data(self.manager.serializer(serializer),
+                         StringIO(row[0]))
+
+        # Record access for `evict()`. Not worth failing a read for
+        # if another process holds the write lock.
+        if now - row[1] > ACCESS_RESOLUTION:
+            try:
+                with conn:
+                    conn.execute('UPDATE cache SET accessed = ? '
+                                 'WHERE name = ? AND serializer = ?',
+                                 (now, name, serializer))
+            except sqlite3.OperationalError:  # database is locked
+                pass
+
+        return data, now - row[2]
+
+    def save(self, name, serializer, data, compression=0):
+        """Save ``data`` under ``name``. See :meth:`FileCache.save`."""
+        conn = self._connect()
+        if data is None:
+            with conn:
+                conn.execute('DELETE FROM cache WHERE name = ? '
+                             'AND serializer = ?', (name, serializer))
+            return True
+
+        fp = StringIO()
+        dump_data(self.manager.serializer(serializer), data, fp, compression)
+        content = fp.getvalue()
+        digest = hashlib.sha1(content).hexdigest()
+        now = time.time()
+        with conn:
+            # Only update timestamps if data are unchanged
+            cursor = conn.execute('UPDATE cache SET modified = ?, '
+                                  'accessed = ? WHERE name = ? AND '
+                                  'serializer = ? AND hash = ?',
+                                  (now, now, name, serializer, digest))
+            if cursor.rowcount:
+                return False
+
+            conn.execute('INSERT OR REPLACE INTO cache '
+                         '(name, serializer, modified, accessed, hash, data) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (name, serializer, now, now, digest,
+                          sqlite3.Binary(content)))
+
+        return True
+
+    def age(self, name, serializer):
+        """Return age of ``name``. See :meth:`FileCache.age`."""
+        row = self._connect().execute(
+            'SELECT modified FROM cache WHERE name = ? AND serializer = ?',
+            (name, serializer)).fetchone()
+
+        if row is None:
+            return 0
+
+        return time.time() - row[0]
+
+    def clear(self, filter_func=lambda f: True):
+        """Delete cached data. See :meth:`FileCache.clear`."""
+        if not os.path.exists(self.dbpath):
+            return
+
+        conn = self._connect()
+        with conn:
+            rows = conn.execute('SELECT name, serializer FROM cache')
+            keys = [(n, s) for n, s in rows.fetchall()
+                    if filter_func('%s.%s' % (n, s))]
+            conn.executemany('DELETE FROM cache WHERE name = ? '
+                             'AND serializer = ?', keys)
+
+    def files(self):
+        """Return names of database files. See :meth:`FileCache.files`."""
+        return [self.filename + suffix for suffix in ('', '-wal', '-shm')]
+
+    def entries(self):
+        """Return keys in database. See :meth:`FileCache.entries`."""
+        if not os.path.exists(self.dbpath):
+            return []
+
+        rows = self._connect().execute(
+            'SELECT name, serializer, length(data), accessed FROM cache')
+        return [CacheEntry('%s.%s' % (n, s), size, accessed)
+                for n, s, size, accessed in rows.fetchall()]
+
+    def evict(self, keys):
+        """Delete keys from database. See :meth:`FileCache.evict`."""
+        if not keys:
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM cache WHERE name || '.' || "
+                             "serializer = ?", [(k,) for k in keys])
+
+        # Return the space to the filesystem. A full VACUUM fails if
+        # another process is using the database, but an incremental
+        # one only needs a write lock. The pragma frees one page per
+        # result row.
+        try:
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+        except sqlite3.OperationalError:  # database is locked
+            pass
+
+
+#: Cache backends by name. Add your own to use them by name.
+BACKENDS = {
+    'file': FileCache,
+    'sqlite': SQLiteCache,
+}
+
+
+def _file_entries(backend):
+    """Return :class:`CacheEntry` of each deletable file in cache directory.
+
+    Files belonging to ``backend``, subdirectories and files with
+    :data:`PROTECTED_SUFFIXES` are skipped.
+    """
+    entries = []
+    if not os.path.exists(backend.dirpath):
+        return entries
+
+    skip = set(backend.files())
+    for filename in os.listdir(backend.dirpath):
+        if filename in skip or filename.endswith(PROTECTED_SUFFIXES):
+            continue
+
+        path = os.path.join(backend.dirpath, filename)
+        try:
+            st = os.stat(path)
+        except OSError:  # deleted by another process
+            continue
+
+        if os.path.isdir(path):
+            continue
+
+        entries.append(CacheEntry(filename, st.st_size,
+                                  max(st.st_atime, st.st_mtime)))
+
+    return entries
+
+
+def evict(backend, max_bytes, min_age=EVICT_MIN_AGE):
+    """Delete least recently used data until cache is under ``max_bytes``.
+
+    .. versionadded:: 1.38
+
+    All the files in the backend's directory (session caches, the
+    arguments of background jobs etc.) are counted, as well as the
+    keys of ``backend``. Log files, the PID files of background jobs
+    and subdirectories are neither counted nor deleted.
+
+    :param backend: backend whose directory should be cleaned up
+    :type backend: :class:`FileCache` or similar
+    :param max_bytes: cache size to shrink to
+    :type max_bytes: ``int``
+    :param min_age: don't delete data accessed in the last
+        ``min_age`` seconds
+    :type min_age: ``int``
+    :returns: ``(size, evicted)``, i.e. total size of the cache in
+        bytes before eviction and the keys of the deleted entries
+    :rtype: ``tuple``
+
+    """
+    entries = _file_entries(backend)
+    files = set(e.key for e in entries)
+    entries.extend(backend.entries())
+
+    size = total = sum(e.size for e in entries)
+    if total <= max_bytes:
+        return size, []
+
+    cutoff = time.time() - min_age
+    evicted = []
+    for entry in sorted(entries, key=lambda e: e.accessed):
+        if total <= max_bytes or entry.accessed > cutoff:
+            break
+
+        if entry.key in files:
+            try:
+                os.unlink(os.path.join(backend.dirpath, entry.key))
+            except OSError:  # deleted by another process
+                pass
+
+        evicted.append(entry.key)
+        total -= entry.size
+
+    backend.evict([k for k in evicted if k not in files])
+
+    return size, evicted
+
+
+def namespace(key):
+    """Return namespace of key or filename ``key`` or ``None``.
+
+    .. versionadded:: 1.38
+
+    :param key: ``<name>.<serializer>``, ``<name>.records`` etc.
+    :type key: ``unicode``
+    :returns: namespace or ``None`` if ``key`` has none
+    :rtype: ``unicode``
+
+    """
+    name = key.rsplit('.', 1)[0]
+    if NAMESPACE_SEPARATOR not in name:
+        return None
+
+    return name.rsplit(NAMESPACE_SEPARATOR, 1)[1]
+
+
+def collect(backend, keep):
+    """Delete data cached in namespaces other than ``keep``.
+
+    .. versionadded:: 1.38
+
+    Like :func:`evict`, this looks at the keys of ``backend`` and all
+    the files in its directory. Data without a namespace are left
+    alone.
+
+    :param backend: backend whose directory should be cleaned up
+    :type backend: :class:`FileCache` or similar
+    :param keep: namespace whose data shouldn't be deleted
+    :type keep: ``unicode``
+    :returns: keys of the deleted entries
+    :rtype: ``list``
+
+    """
+    def _old(key):
+        ns = namespace(key)
+        return ns is not None and ns != keep
+
+    deleted = []
+    for entry in _file_entries(backend):
+        if _old(entry.key):
+            try:
+                os.unlink(os.path.join(backend.dirpath, entry.key))
+            except OSError:  # deleted by another process
+                continue
+            deleted.append(entry.key)
+
+    keys = [e.key for e in backend.entries() if _old(e.key)]
+    backend.evict(keys)
+
+    return deleted + keys
+
+
+def main(wf):  # pragma: no cover
+    """Shrink cache or delete old namespaces.
+
+    Run by :meth:`Workflow.check_cache_size()
+    <workflow.Workflow.check_cache_size>` as ``cache.py evict <max_bytes>``
+    and by :meth:`Workflow.check_cache_namespace()
+    <workflow.Workflow.check_cache_namespace>` as
+    ``cache.py gc <namespace>``.
+
+    """
+    action, arg = wf.args[:2]
+    if action == 'evict':
+        wf.evict_cache(int(arg))
+    elif action == 'gc':
+        wf.collect_cache_garbage(arg)
+    else:
+        raise ValueError('Unknown action: {0}'.format(action))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    from workflow import Workflow
+    Workflow().run(main)
@@ -0,0 +1,168 @@
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Rank items by how often and how recently they were used.
+
+.. versionadded:: 1.38
+
+A :class:`Frecency` store records when items are used, and its
+:meth:`~Frecency.weight` method can be passed to
+:meth:`Workflow.filter() <workflow.Workflow.filter>` as ``weight``,
+so frequently-used items are ranked higher::
+
+    usage = Frecency(wf.datafile('usage.frecency'))
+    results = wf.filter(query, servers, attrgetter('name'),
+                        weight=lambda s: usage.weight(s.name))
+
+    # later, when a server is used
+    usage.record(server.name)
+
+Each use is worth 1 point, and points decay exponentially, halving
+every ``half_life`` seconds. Only the decayed score and the time of
+the last use are stored for each key, so the store stays small and
+is loaded with a single read. Keys whose score has decayed below
+:data:`MIN_SCORE` are dropped when the store is saved.
+
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import math
+import marshal
+import os
+import time
+
+from .util import AcquisitionError, LockFile, atomic_writer
+
+# Version of the file format. Incremented when the format changes.
+FORMAT_VERSION = 1
+
+# Points of a use halve every 14 days by default
+DEFAULT_HALF_LIFE = 14 * 24 * 60 * 60
+
+# Keys with a lower score are deleted when the store is saved. A single
+# use decays to this after about 6.6 half-lives (3 months by default).
+MIN_SCORE = 0.01
+
+# Seconds to wait for another process to finish saving the store
+LOCK_TIMEOUT = 0.5
+
+
+class Frecency(object):
+    """Usage scores of keys, decaying with time.
+
+    .. versionadded:: 1.38
+
+    The file at ``filepath`` is read the first time a score is
+    needed. If it doesn't exist or can't be read, all scores are 0.
+
+    :param filepath: where to save the usage data
+    :type filepath: ``unicode``
+    :param half_life: seconds after which a use is worth half
+    :type half_life: ``int``
+
+    """
+
+    def __init__(self, filepath, half_life=DEFAULT_HALF_LIFE):
+        """Create new :class:`Frecency` store."""
+        self.filepath = filepath
+        self.half_life = half_life
+        self._data = None
+
+    @property
+    def data(self):
+        """Mapping of keys to ``(score, timestamp)`` tuples."""
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _load(self):
+        """Read data from file."""
+        if not os.path.exists(self.filepath):
+            return {}
+
+        try:
+            with open(self.filepath, 'rb') as fp:
+                version, data = marshal.load(fp)
+        except (EOFError, ValueError, TypeError):
+            return {}
+
+        if version != FORMAT_VERSION:
+            return {}
+
+        return data
+
+    def _decayed(self, score, timestamp, now):
+        """Return ``score`` at ``timestamp`` decayed to ``now``."""
+        return score * math.pow(2, -(now - timestamp) / float(self.half_life))
+
+    def score(self, key, now=None):
+        """Return current usage score of ``key``.
+
+        :param key: key to get score for
+        :type key: ``unicode``
+        :param now: time to calculate score at. Default is current time.
+        :type now: ``float``
+        :returns: decayed sum of uses (``0.0`` if never used)
+        :rtype: ``float``
+
+        """
+        if key not in self.data:
+            return 0.0
+
+        score, timestamp = self.data[key]
+        return self._decayed(score, timestamp, now or time.time())
+
+    def weight(self, key):
+        """Return factor to multiply ``key``'s filter score by.
+
+        :param key: key to get weight for
+        :type key: ``unicode``
+        :returns: ``1 + log(1 + score)``, i.e. ``1.0`` for unused keys.
+            The logarithm stops heavily-used keys from swamping
+            better matches.
+        :rtype: ``float``
+
+        """
+        return 1.0 + math.log1p(self.score(key))
+
+    def record(self, key, now=None):
+        """Record a use of ``key`` and save the store.
+
+        The use isn't recorded if another process is saving the store
+        and doesn't finish within :data:`LOCK_TIMEOUT` seconds.
+
+        :param key: key that was used
+        :type key: ``unicode``
+        :param now: time of use. Default is current time.
+        :type now: ``float``
+        :returns: ``True`` if the use was recorded, else ``False``
+        :rtype: ``bool``
+
+        """
+        now = now or time.time()
+        try:
+            with LockFile(self.filepath, LOCK_TIMEOUT):
+                # Re-read in case another process has recorded a use
+                self._data = self._load()
+                self._data[key] = (self.score(key, now) + 1.0, now)
+                self._prune(now)
+
+                with atomic_writer(self.filepath, 'wb') as fp:
+                    marshal.dump((FORMAT_VERSION, self._data), fp)
+        except AcquisitionError:
+            return False
+
+        return True
+
+    def _prune(self, now):
+        """Delete keys whose score has decayed below :data:`MIN_SCORE`."""
+        for key, (score, timestamp) in self._data.items():
+            if self._decayed(score, timestamp, now) < MIN_SCORE:
+                del self._data[key]
@@ -0,0 +1,528 @@
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Search indices to speed up :meth:`Workflow.filter() <workflow.Workflow.filter>`.
+
+.. versionadded:: 1.38
+
+Building an index costs more than a single call to
+:meth:`~workflow.Workflow.filter`, so indices are only worthwhile
+for large lists, and should be cached alongside the items they
+were built from::
+
+    index = wf.cached_data('servers-index',
+                           lambda: TrigramIndex([s.name for s in servers]),
+                           max_age=0)
+    results = wf.filter(query, servers, attrgetter('name'), index=index)
+
+Indices pickle to a compact binary form, so they can be stored with
+the :ref:`caching API <caching-data>`.
+
+:class:`BKTree` finds keys containing words within a given edit
+distance of the query's, so mistyped queries can still find matches.
+It is a fallback for when :meth:`~workflow.Workflow.filter` finds
+nothing, not a replacement for it.
+
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from array import array
+import hashlib
+import marshal
+
+from .workflow import (
+    _CHARSET_TYPECODE,
+    _charset_mask,
+    INITIALS,
+    fold_to_ascii,
+    split_on_delimiters,
+)
+
+# Version of the serialized format. Incremented when the format changes.
+FORMAT_VERSION = 3
+
+# Posting lists are arrays of unsigned ints
+_TYPECODE = b'I'
+
+
+def trigrams(text):
+    """Return set of the three-character substrings of ``text``.
+
+    :param text: text to split
+    :type text: ``unicode``
+    :returns: trigrams in ``text``. Empty if ``text`` has fewer
+        than three characters.
+    :rtype: ``set``
+
+    """
+    return set([text[i:i + 3] for i in range(len(text) - 2)])
+
+
+def levenshtein(a, b):
+    """Return edit distance between two strings.
+
+    The number of single-character insertions, deletions and
+    substitutions needed to turn ``a`` into ``b``.
+
+    :param a: first string
+    :type a: ``unicode``
+    :param b: second string
+    :type b: ``unicode``
+    :returns: edit distance
+    :rtype: ``int``
+
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+
+    previous = range(len(b) + 1)
+    for i, ca in enumerate(a):
+        current = [i + 1]
+        for j, cb in enumerate(b):
+            current.append(min(previous[j + 1] + 1,
+                               current[j] + 1,
+                               previous[j] + (ca != cb)))
+        previous = current
+
+    return previous[-1]
+
+
+def max_typos(word):
+    """Return number of typos to tolerate in ``word``.
+
+    One per three characters, up to three. Words shorter than three
+    characters must match exactly.
+
+    :param word: query word
+    :type word: ``unicode``
+    :rtype: ``int``
+
+    """
+    if len(word) < 3:
+        return 0
+    return min(3, (len(word) + 1) // 3)
+
+
+def fingerprint(keys):
+    """Return fingerprint of a list of search keys.
+
+    :param keys: search keys
+    :type keys: ``list`` of ``unicode``
+    :returns: hex digest of ``keys``
+    :rtype: ``str``
+
+    """
+    return hashlib.sha1('\0'.join(keys).encode('utf-8')).hexdigest()
+
+
+def _search_strings(value):
+    """Return strings :meth:`Workflow.filter` matches ``value`` against.
+
+    These are the folded, lower-case ``value``, its capitals, and the
+    initials of its atoms, i.e. the strings a query must be a substring
+    of to match any rule except ``MATCH_ALLCHARS``.
+
+    """
+    value = fold_to_ascii(value.strip())
+    capitals = ''.join([c for c in value if c in INITIALS]).lower()
+    value = value.lower()
+    initials = ''.join([s[0] for s in split_on_delimiters(value) if s])
+
+    return value, capitals, initials
+
+
+class TrigramIndex(object):
+    """Inverted index of the trigrams in a list of search keys.
+
+    .. versionadded:: 1.38
+
+    Pass an instance to :meth:`Workflow.filter()
+    <workflow.Workflow.filter>` as ``index`` to only score items that
+    contain all the trigrams of the query instead of scanning every item.
+    The index must be built from the same items (in the same order)
+    as are passed to :meth:`~workflow.Workflow.filter`, which ignores
+    an index that doesn't match the items.
+
+    To check, :meth:`~workflow.Workflow.filter` compares the index's
+    :attr:`digest` to the ``digest`` attribute of the items (e.g.
+    :attr:`RecordTable.digest <workflow.records.RecordTable.digest>`),
+    so pass that as ``digest`` if you have it. Otherwise, it calls
+    ``key`` on every item to compare the :func:`fingerprint` of
+    their keys, which is much slower for long lists.
+
+    Keys are indexed in folded, lower-case form, along with their
+    capitals and the initials of their atoms, so the index covers
+    every ``MATCH_*`` rule except :const:`~workflow.MATCH_ALLCHARS`.
+
+    :param keys: search keys of the items, i.e. the values
+        the ``key`` function passed to
+        :meth:`~workflow.Workflow.filter` returns.
+    :type keys: iterable of ``unicode``
+    :param digest: digest of the items the keys belong to. The
+        default is the :func:`fingerprint` of ``keys``.
+    :type digest: ``str``
+
+    """
+
+    def __init__(self, keys=(), digest=None):
+        """Create new :class:`TrigramIndex` for ``keys``."""
+        keys = list(keys)
+        self._size = 0
+        self._postings = {}
+        #: Digest of the indexed items (see above)
+        self.digest = digest or fingerprint(keys)
+        #: Bitmasks of the characters in the folded keys, so
+        #: :meth:`~workflow.Workflow.filter` needn't compute them
+        #: on every call
+        self.charset_masks = array(_CHARSET_TYPECODE)
+
+        postings = {}
+        for i, key in enumerate(keys):
+            grams = set()
+            strings = _search_strings(key)
+            for s in strings:
+                grams.update(trigrams(s))
+
+            self.charset_masks.append(_charset_mask(strings[0]))
+
+            for gram in grams:
+                if gram not in postings:
+                    postings[gram] = array(_TYPECODE)
+                postings[gram].append(i)
+
+            self._size = i + 1
+
+        self._postings = postings
+
+    def __len__(self):
+        """Number of indexed keys."""
+        return self._size
+
+    def built_from(self, keys):
+        """Return ``True`` if index was built from ``keys``.
+
+        Always ``False`` if the index was built with a ``digest``
+        other than the keys' :func:`fingerprint`.
+
+        :param keys: search keys
+        :type keys: ``list`` of ``unicode``
+        :rtype: ``Boolean``
+
+        """
+        if len(keys) != self._size:
+            return False
+        return fingerprint(keys) == self.digest
+
+    def candidates(self, word):
+        """Return indices of keys that may match ``word``.
+
+        :param word: (lower-case, ASCII) query word
+        :type word: ``unicode``
+        :returns: sorted list of indices or ``None`` if ``word`` is
+            too short to narrow down the candidates.
+        :rtype: ``list`` or ``None``
+
+        """
+        grams = trigrams(word)
+        if not grams:
+            return None
+
+        postings = []
+        for gram in grams:
+            if gram not in self._postings:
+                return []
+            postings.append(self._postings[gram])
+
+        # Intersect, starting with the shortest posting list
+        postings.sort(key=len)
+        hits = set(postings[0])
+        for p in postings[1:]:
+            hits.intersection_update(p)
+            if not hits:
+                break
+
+        return sorted(hits)
+
+    def dumps(self):
+        """Serialize index to a compact binary string.
+
+        :returns: serialized index
+        :rtype: ``str``
+
+        """
+        data = dict((gram, p.tostring())
+                    for gram, p in self._postings.items())
+
+        return marshal.dumps((FORMAT_VERSION, self._size, data,
+                              self.digest, self.charset_masks.tostring()))
+
+    @classmethod
+    def loads(cls, data):
+        """Load index serialized with :meth:`dumps`.
+
+        Raises a :class:`ValueError` if ``data`` is in an unsupported format.
+
+        :param data: serialized index
+        :type data: ``str``
+        :returns: index
+        :rtype: :class:`TrigramIndex`
+
+        """
+        index = cls()
+        index.__setstate__(data)
+        return index
+
+    def __getstate__(self):
+        """Support pickling in compact format."""
+        return self.dumps()
+
+    def __setstate__(self, state):
+        """Load from pickle."""
+        state = marshal.loads(state)
+        if state[0] != FORMAT_VERSION:
+            raise ValueError('unsupported index format: {0!r}'.format(
+                             state[0]))
+
+        _, size, data, digest, s = state
+        masks = array(_CHARSET_TYPECODE)
+        masks.fromstring(s)
+
+        postings = {}
+        for gram, s in data.items():
+            p = array(_TYPECODE)
+            p.fromstring(s)
+            postings[gram] = p
+
+        self._size = size
+        self._postings = postings
+        self.digest = digest
+        self.charset_masks = masks
+
+
+class BKTree(object):
+    """Burkhard-Keller tree of the words in a list of search keys.
+
+    .. versionadded:: 1.38
+
+    Finds keys containing words within a given :func:`levenshtein`
+    distance of a query's words, e.g. ``frnakfurt`` finds
+    ``Server 1 Frankfurt``. Searching only compares the query against
+    a fraction of the words, but is still much slower than
+    :meth:`Workflow.filter() <workflow.Workflow.filter>`, so only use it
+    when :meth:`~workflow.Workflow.filter` finds nothing.
+
+    Keys are split into words in folded, lower-case form. Like
+    :class:`TrigramIndex`, instances pickle to a compact binary form.
+
+    :param keys: search keys of the items
+    :type keys: iterable of ``unicode``
+
+    """
+
+    def __init__(self, keys=()):
+        """Create new :class:`BKTree` for ``keys``."""
+        self._size = 0
+        # Tree is stored flat. Node ``n`` is word ``_words[n]`` and
+        # ``_children[n]`` maps distances to child nodes.
+        self._words = []
+        self._children = []
+        # Node -> indices of keys containing the node's word
+        self._postings = []
+        nodes = {}
+
+        for i, key in enumerate(keys):
+            for word in set(self._split(key)):
+                if word not in nodes:
+                    nodes[word] = self._add(word)
+                self._postings[nodes[word]].append(i)
+
+            self._size = i + 1
+
+        # Nodes in alphabetical order of their words, for prefix search
+        self._order = array(_TYPECODE, sorted(range(len(self._words)),
+                                              key=self._words.__getitem__))
+
+    def __len__(self):
+        """Number of indexed keys."""
+        return self._size
+
+    @staticmethod
+    def _split(key):
+        """Return words in ``key``."""
+        return [w for w in
+                split_on_delimiters(fold_to_ascii(key.strip()).lower()) if w]
+
+    def _add(self, word):
+        """Add ``word`` to tree and return its node."""
+        new = len(self._words)
+        self._words.append(word)
+        self._children.append({})
+        self._postings.append(array(_TYPECODE))
+
+        node = 0
+        while new:
+            d = levenshtein(word, self._words[node])
+            children = self._children[node]
+            if d not in children:
+                children[d] = new
+                break
+            node = children[d]
+
+        return new
+
+    def search(self, word, max_distance):
+        """Return indexed words within ``max_distance`` of ``word``.
+
+        :param word: (lower-case, ASCII) word to search for
+        :type word: ``unicode``
+        :param max_distance: maximum edit distance
+        :type max_distance: ``int``
+        :returns: ``(distance, word)`` tuples, nearest first
+        :rtype: ``list``
+
+        """
+        return [(d, self._words[n])
+                for d, n in self._search(word, max_distance)]
+
+    def _search(self, word, max_distance):
+        """Return ``(distance, node)`` tuples within ``max_distance``."""
+        if not self._words:
+            return []
+
+        hits = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            d = levenshtein(word, self._words[node])
+            if d <= max_distance:
+                hits.append((d, node))
+
+            # Triangle inequality: only subtrees with distances
+            # in this range can contain words close enough
+            for cd, child in self._children[node].items():
+                if d - max_distance <= cd <= d + max_distance:
+                    stack.append(child)
+
+        hits.sort()
+        return hits
+
+    def candidates(self, query):
+        """Return indices of keys matching all words of ``query``.
+
+        Each word of ``query`` must be within :func:`max_typos` of
+        a word in the key, or be the start of one.
+
+        :param query: query
+        :type query: ``unicode``
+        :returns: ``(distance, index)`` tuples, sorted by total
+            edit distance of the query words
+        :rtype: ``list``
+
+        """
+        distances = None
+        for word in self._split(query):
+            best = {}
+            hits = self._search(word, max_typos(word))
+            # Partially-typed words are prefixes of the right one
+            hits.extend([(0, n) for n in self._prefixed(word)])
+
+            for d, node in hits:
+                for i in self._postings[node]:
+                    if d < best.get(i, d + 1):
+                        best[i] = d
+
+            if distances is None:
+                distances = best
+            else:
+                distances = dict((i, d + best[i])
+                                 for i, d in distances.items() if i in best)
+
+            if not distances:
+                return []
+
+        if distances is None:  # empty query
+            return []
+
+        return sorted((d, i) for i, d in distances.items())
+
+    def _prefixed(self, prefix):
+        """Return nodes whose words start with ``prefix``."""
+        words, order = self._words, self._order
+        # Binary search for the first word >= prefix
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if words[order[mid]] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        nodes = []
+        while lo < len(order) and words[order[lo]].startswith(prefix):
+            nodes.append(order[lo])
+            lo += 1
+
+        return nodes
+
+    def dumps(self):
+        """Serialize tree to a compact binary string.
+
+        :returns: serialized tree
+        :rtype: ``str``
+
+        """
+        postings = [p.tostring() for p in self._postings]
+        return marshal.dumps((FORMAT_VERSION, self._size, self._words,
+                              self._children, postings,
+                              self._order.tostring()))
+
+    @classmethod
+    def loads(cls, data):
+        """Load tree serialized with :meth:`dumps`.
+
+        Raises a :class:`ValueError` if ``data`` is in an unsupported format.
+
+        :param data: serialized tree
+        :type data: ``str``
+        :returns: tree
+        :rtype: :class:`BKTree`
+
+        """
+        tree = cls()
+        tree.__setstate__(data)
+        return tree
+
+    def __getstate__(self):
+        """Support pickling in compact format."""
+        return self.dumps()
+
+    def __setstate__(self, state):
+        """Load from pickle."""
+        state = marshal.loads(state)
+        if state[0] != FORMAT_VERSION:
+            raise ValueError('unsupported index format: {0!r}'.format(
+                             state[0]))
+
+        _, size, words, children, data, order = state
+
+        postings = []
+        for s in data:
+            p = array(_TYPECODE)
+            p.fromstring(s)
+            postings.append(p)
+
+        self._size = size
+        self._words = words
+        self._children = children
+        self._postings = postings
+        self._order = array(_TYPECODE)
+        self._order.fromstring(order)
@@ -0,0 +1,187 @@
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Memory-mapped lists of records, read without loading the whole file.
+
+.. versionadded:: 1.38
+
+:meth:`Workflow.cached_data() <workflow.Workflow.cached_data>` reads
+and deserializes the whole cache file, even if a Script Filter only
+shows the first few items that match the query. A :class:`RecordTable`
+file is :mod:`mmap`-ed instead, and a record is only decoded when
+it's accessed, so a large list of which only a few records are needed
+costs time and memory in proportion to those records::
+
+    RecordTable.write(path, servers)
+    table = RecordTable(path)
+    len(table)  # doesn't decode anything
+    table[42]   # only decodes record 42
+
+A :class:`RecordTable` is a read-only :class:`~collections.Sequence`,
+so it can be passed to :meth:`Workflow.filter()
+<workflow.Workflow.filter>` as ``items``. With an ``index``, only the
+records the index returns as candidates are decoded.
+
+Use :meth:`Workflow.cached_records() <workflow.Workflow.cached_records>`
+to cache a list as a :class:`RecordTable`.
+
+The file consists of a header, the record type's name and fields,
+a table of fixed-size ``(offset, length)`` entries (one per record),
+and the records, each serialized with :mod:`marshal`. The header
+contains a SHA-1 digest of the rest of the file, so data derived from
+a table (e.g. a search index of record positions) can be tied to it
+with :attr:`RecordTable.digest`.
+
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple, Sequence
+import hashlib
+import marshal
+import mmap
+import struct
+
+from util import write_if_changed
+
+# Identifies record table files
+MAGIC = b'AWRT'
+
+# Version of the file format. Incremented when the format changes.
+FORMAT_VERSION = 2
+
+# magic, format version, marshal version, record count, length of meta,
+# SHA-1 digest of the rest of the file
+HEADER = struct.Struct(b'<4sBBII20s')
+
+# Offset and length of each record
+ENTRY = struct.Struct(b'<II')
+
+# namedtuple types of tables, keyed by (typename, fields)
+_record_types = {}
+
+
+def _record_type(typename, fields):
+    """Return (cached) namedtuple type."""
+    key = (typename, fields)
+    if key not in _record_types:
+        _record_types[key] = namedtuple(typename, fields)
+    return _record_types[key]
+
+
+class RecordTable(Sequence):
+    """Read-only, memory-mapped list of records.
+
+    .. versionadded:: 1.38
+
+    Records are tuples or :func:`~collections.namedtuple` instances
+    of the types :mod:`marshal` supports. A table of namedtuples
+    returns instances of an equivalent namedtuple type (not the same
+    class).
+
+    Records are decoded the first time they're accessed and kept,
+    so repeated access (e.g. by several ``key`` functions) is cheap.
+
+    Raises a :class:`ValueError` if the file at ``filepath`` isn't
+    a record table or was written by a different version.
+
+    :param filepath: path of file written by :meth:`write`
+    :type filepath: ``unicode``
+
+    """
+
+    def __init__(self, filepath):
+        """Open and map record table at ``filepath``."""
+        self.filepath = filepath
+        with open(filepath, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < HEADER.size:
+            raise ValueError('Not a record table: {0}'.format(filepath))
+
+        magic, version, marshal_version, count, metasize, digest = \
+            HEADER.unpack_from(self._map)
+        if (magic, version, marshal_version) != (MAGIC, FORMAT_VERSION,
+                                                 marshal.version):
+            raise ValueError('Unsupported record table: {0}'.format(
+                             filepath))
+
+        self._count = count
+        #: Hex SHA-1 digest of the records. Tables with the same
+        #: records have the same digest.
+        self.digest = digest.encode('hex')
+        typename, fields = marshal.loads(
+            self._map[HEADER.size:HEADER.size + metasize])
+        self._type = _record_type(typename, fields) if fields else None
+        self._entries = HEADER.size + metasize
+        self._records = {}
+
+    @classmethod
+    def write(cls, filepath, records):
+        """Save ``records`` to a record table at ``filepath``.
+
+        The file is replaced atomically, so open tables keep reading
+        the old file. If the file already contains ``records``, only
+        its modification time is updated.
+
+        :param filepath: where to save the table
+        :type filepath: ``unicode``
+        :param records: tuples or namedtuples of the same type
+        :type records: ``list``
+        :returns: ``False`` if the file was unchanged, else ``True``
+        :rtype: ``bool``
+
+        """
+        typename, fields = None, ()
+        if records and hasattr(records[0], '_fields'):
+            typename = type(records[0]).__name__
+            fields = tuple(records[0]._fields)
+
+        meta = marshal.dumps((typename, fields))
+        data = [marshal.dumps(tuple(r)) for r in records]
+
+        offset = HEADER.size + len(meta) + ENTRY.size * len(data)
+        entries = []
+        for s in data:
+            entries.append(ENTRY.pack(offset, len(s)))
+            offset += len(s)
+
+        body = b''.join([meta, b''.join(entries), b''.join(data)])
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version,
+                             len(data), len(meta), hashlib.sha1(body).digest())
+        return write_if_changed(filepath, header + body)
+
+    def close(self):
+        """Unmap file."""
+        self._map.close()
+
+    def __len__(self):
+        """Number of records. Doesn't decode any."""
+        return self._count
+
+    def __getitem__(self, i):
+        """Return record ``i``, decoding it if necessary."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError('record index out of range')
+
+        record = self._records.get(i)
+        if record is None:
+            offset, size = ENTRY.unpack_from(self._map,
+                                             self._entries + ENTRY.size * i)
+            record = marshal.loads(buffer(self._map, offset, size))
+            if self._type is not None:
+                record = self._type._make(record)
+            self._records[i] = record
+
+        return record
@@ -41,6 +41,8 @@ RELEASES_BASE = 'https://api.github.com/repos/{}/releases'
 match_workflow = re.compile(r'\.alfred(\d+)?workflow$').search
 
 _wf = None
+# Keys of the releases caches registered with `wf()`
+_registered = set()
 
 
 def wf():
@@ -398,6 +400,25 @@ def get_downloads(repo):
     Returns:
         list: Sequence of `Download` contained in GitHub releases.
     """
+    js = wf().cached(_releases_cache(repo))
+
+    return Download.from_releases(js)
+
+
+def _releases_cache(repo):
+    """Register cache policy for GitHub repo's releases once.
+
+    Args:
+        repo (unicode): GitHub repo to load releases for.
+
+    Returns:
+        unicode: Name of cache.
+
+    """
+    key = 'github-releases-' + repo.replace('/', '-')
+    if key in _registered:
+        return key
+
     url = build_api_url(repo)
 
     def _fetch():
@@ -406,10 +427,11 @@ def get_downloads(repo):
         r.raise_for_status()
         return r.content
 
-    key = 'github-releases-' + repo.replace('/', '-')
-    js = wf().cached_data(key, _fetch, max_age=60)
+    # The JSON is large and repetitive, so compresses well
+    wf().register_cache_policy(key, _fetch, ttl=60, compression=6)
+    _registered.add(key)
 
-    return Download.from_releases(js)
+    return key
 
 
 def latest_download(dls, alfred_version=None, prereleases=False):
@@ -345,6 +345,59 @@ def appinfo(name):
     return AppInfo(unicodify(name), unicodify(path), unicodify(bid))
 
 
+def lru_cache(maxsize=128):
+    """Decorator that memoizes a function's most recent results.
+
+    .. versionadded:: 1.38
+
+    A cheap version of Python 3's :func:`functools.lru_cache`. Results
+    are kept in two generations of up to ``maxsize / 2`` entries each.
+    Hits in the old generation are moved to the new one, and when the
+    new generation is full, the old one is discarded. This approximates
+    least-recently-used eviction using only :class:`dict` operations.
+
+    The wrapped function's arguments must be hashable. The cache can be
+    emptied with the wrapper's ``cache_clear()`` method.
+
+    Args:
+        maxsize (int, optional): Maximum number of results to cache.
+
+    Returns:
+        callable: Decorator.
+
+    """
+    def decorator(func):
+        cache = {'new': {}, 'old': {}}
+        size = max(maxsize // 2, 1)
+
+        missing = object()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            new = cache['new']
+            result = new.get(args, missing)
+            if result is not missing:
+                return result
+
+            result = cache['old'].pop(args, missing)
+            if result is missing:
+                result = func(*args)
+
+            if len(new) >= size:
+                cache['old'], cache['new'] = new, {}
+
+            cache['new'][args] = result
+            return result
+
+        def cache_clear():
+            cache['new'], cache['old'] = {}, {}
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
 @contextmanager
 def atomic_writer(fpath, mode):
     """Atomic file writer.
@@ -373,6 +426,38 @@ def atomic_writer(fpath, mode):
                 pass
 
 
+def write_if_changed(fpath, data):
+    """Atomically write ``data`` to ``fpath`` unless it already contains it.
+
+    .. versionadded:: 1.38
+
+    If the file's contents are already ``data``, it isn't rewritten,
+    but its modification time is updated. The file is only read if
+    its size matches.
+
+    :param fpath: path of file to write to.
+    :type fpath: ``unicode``
+    :param data: file contents
+    :type data: ``str``
+    :returns: ``True`` if the file was written, ``False`` if not.
+    :rtype: ``bool``
+
+    """
+    try:
+        if os.path.getsize(fpath) == len(data):
+            with open(fpath, 'rb') as fp:
+                if fp.read() == data:
+                    os.utime(fpath, None)
+                    return False
+    except (OSError, IOError):  # doesn't exist
+        pass
+
+    with atomic_writer(fpath, 'wb') as fp:
+        fp.write(data)
+
+    return True
+
+
 class LockFile(object):
     """Context manager to protect filepaths with lockfiles.
 
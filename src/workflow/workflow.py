@@ -21,18 +21,23 @@ up your Python script to best utilise the :class:`Workflow` object.
 
 from __future__ import print_function, unicode_literals
 
+from array import array
 import binascii
+from collections import Counter, namedtuple, OrderedDict, Sequence
+from contextlib import contextmanager
 import cPickle
-from copy import deepcopy
+import hashlib
 import json
 import logging
 import logging.handlers
+import marshal
 import os
 import pickle
 import plistlib
 import re
 import shutil
 import string
+import struct
 import subprocess
 import sys
 import time
@@ -44,10 +49,17 @@ except ImportError:  # pragma: no cover
     import xml.etree.ElementTree as ET
 
 # imported to maintain API
+from cache import BACKENDS as CACHE_BACKENDS
+from cache import evict as evict_cache_entries
+from cache import collect as collect_cache_garbage
+from cache import NAMESPACE_SEPARATOR as CACHE_NAMESPACE_SEPARATOR
+from cache import dump_data, load_data
+from records import RecordTable
 from util import AcquisitionError  # noqa: F401
 from util import (
     atomic_writer,
     LockFile,
+    lru_cache,
     uninterruptible,
 )
 
@@ -388,6 +400,21 @@ ASCII_REPLACEMENTS = {
     'ỹ': 'y',
 }
 
+#: Number of folded strings :func:`fold_to_ascii` caches
+FOLD_CACHE_SIZE = 10000
+
+# `unicode.translate` table for `fold_to_ascii`. A list is much faster
+# than a dict. It covers Latin-1 Supplement and Latin Extended, which
+# are mapped via `ASCII_REPLACEMENTS` or to their decomposed ASCII forms,
+# so most text doesn't need the (much slower) fallback. Characters outside
+# the table are left unchanged by `translate`.
+_ASCII_TABLE = [unichr(_cp) for _cp in range(0x250)]
+for _cp in range(0x80, 0x250):
+    _c = unichr(_cp)
+    _s = unicodedata.normalize('NFKD', _c).encode('ascii', 'ignore')
+    _ASCII_TABLE[_cp] = ASCII_REPLACEMENTS.get(_c, unicode(_s) or _c)
+del _cp, _c, _s
+
 ####################################################################
 # Smart-to-dumb punctuation mapping
 ####################################################################
@@ -415,6 +442,37 @@ INITIALS = string.ascii_uppercase + string.digits
 #: Split on non-letters, numbers
 split_on_delimiters = re.compile('[^a-zA-Z0-9]').split
 
+# Character-set bitmasks for the pre-filter in `Workflow.filter`.
+# Each lower-case ASCII letter and digit has its own bit. All other
+# characters share the top bit, so for those the mask is only a
+# necessary condition and the exact set test is run as well.
+_CHARSET_BITS = dict((c, 1 << i) for i, c in
+                     enumerate(string.ascii_lowercase + string.digits))
+_CHARSET_CHARS = frozenset(_CHARSET_BITS)
+#: Bit shared by all characters without their own bit
+_CHARSET_OTHER = 1 << len(_CHARSET_BITS)
+# Masks need 37 bits. `unsigned long` is 64 bits on macOS.
+_CHARSET_TYPECODE = b'L'
+#: Use NumPy (if installed) for the pre-filter on lists at least this long
+NUMPY_THRESHOLD = 50000
+
+# Parallel filtering. See `Workflow.parallel_filter_threshold`.
+#: Never score fewer items than this in parallel
+PARALLEL_MIN_ITEMS = 5000
+#: Number of items scored serially to measure the cost of scoring
+PARALLEL_SAMPLE_SIZE = 500
+#: Assumed cost of starting a process pool (in seconds) until measured
+DEFAULT_POOL_STARTUP = 0.15
+# Data for process pool workers
+_filter_state = None
+
+#: Items scored between checks of :meth:`Workflow.filter`'s ``deadline_ms``
+DEADLINE_CHUNK_SIZE = 500
+#: Seconds after which Alfred re-runs a Script Filter that ran out of time
+DEADLINE_RERUN = 0.1
+#: Seconds after which a saved filter cursor is ignored
+DEADLINE_CURSOR_MAX_AGE = 30
+
 # Match filter flags
 #: Match items that start with ``query``
 MATCH_STARTSWITH = 1
@@ -445,6 +503,23 @@ MATCH_ALL = 127
 DEFAULT_UPDATE_FREQUENCY = 1
 
 
+####################################################################
+# Used by `Workflow.check_cache_size`
+####################################################################
+
+# Number of seconds to wait between checking the size of the cache
+CACHE_EVICT_INTERVAL = 3600
+
+#: Seconds :meth:`Workflow.cached_data` waits for another process to
+#: regenerate data before regenerating it itself
+CACHE_LOCK_TIMEOUT = 3.0
+
+#: Size at which the cache statistics file is rotated
+CACHE_STATS_MAX_BYTES = 256 * 1024
+# Matches the session prefix of cache keys
+SESSION_PREFIX = re.compile(r'^_wfsess-[0-9a-f]+-')
+
+
 ####################################################################
 # Keychain access errors
 ####################################################################
@@ -483,6 +558,10 @@ class PasswordExists(KeychainError):
 # Helper functions
 ####################################################################
 
+# Much faster than catching `UnicodeEncodeError` for non-ASCII text
+_search_non_ascii = re.compile(r'[^\x00-\x7f]').search
+
+
 def isascii(text):
     """Test if ``text`` contains only ASCII characters.
 
@@ -492,11 +571,104 @@ def isascii(text):
     :rtype: ``Boolean``
 
     """
-    try:
-        text.encode('ascii')
-    except UnicodeEncodeError:
-        return False
-    return True
+    return _search_non_ascii(text) is None
+
+
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent.
+
+    .. versionadded:: 1.38
+
+    Function version of :meth:`Workflow.fold_to_ascii`.
+
+    :param text: text to convert
+    :type text: ``unicode``
+    :returns: text containing only ASCII characters
+    :rtype: ``unicode``
+
+    """
+    if isascii(text):
+        return text
+    return _fold_to_ascii(text)
+
+
+@lru_cache(FOLD_CACHE_SIZE)
+def _fold_to_ascii(text):
+    """Fold non-ASCII ``text``. Results are cached."""
+    text = text.translate(_ASCII_TABLE)
+    if isascii(text):
+        return text
+
+    # Characters not in the table
+    text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+    return unicode(unicodedata.normalize('NFKD',
+                   text).encode('ascii', 'ignore'))
+
+
+def _filter_chunk(matches):
+    """Score a chunk of items in a :meth:`Workflow.filter` process pool.
+
+    The data are taken from the global `_filter_state`, which is set
+    before the pool's processes are forked, so they don't have to be
+    pickled.
+
+    Returns only the top ``max_results`` results that beat ``min_score``.
+
+    """
+    scorer, args, ascending, min_score, max_results = _filter_state
+    scored = scorer(matches, *args)
+
+    if min_score:
+        scored = [t for t in scored if t[2] > min_score]
+
+    if max_results and len(scored) > max_results:
+        scored.sort(reverse=ascending)
+        scored = scored[:max_results]
+
+    return scored
+
+
+def _charset_mask(text):
+    """Return bitmask of the characters in ``text``.
+
+    ``text`` should already be lower-case (and folded, if required).
+    Characters without their own bit set :data:`_CHARSET_OTHER`.
+
+    """
+    chars = set(text)
+    # Each character has a distinct bit, so the sum is a bitwise OR
+    mask = sum(map(_CHARSET_BITS.__getitem__, chars & _CHARSET_CHARS))
+    if not chars <= _CHARSET_CHARS:
+        mask |= _CHARSET_OTHER
+
+    return mask
+
+
+def _charset_matches(masks, qmask):
+    """Return indices of ``masks`` that have all bits in ``qmask`` set.
+
+    Uses NumPy if it's installed and ``masks`` is at least
+    :data:`NUMPY_THRESHOLD` long.
+
+    :param masks: bitmasks as returned by :func:`_charset_mask`
+    :type masks: :class:`array.array`
+    :param qmask: bitmask of the query
+    :type qmask: ``int``
+    :returns: indices of matching masks
+    :rtype: ``list``
+
+    """
+    if len(masks) >= NUMPY_THRESHOLD:
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            a = numpy.frombuffer(masks, dtype=numpy.uint64)
+            q = numpy.uint64(qmask)
+            return numpy.flatnonzero(a & q == q).tolist()
+
+    return [i for i, m in enumerate(masks) if m & qmask == qmask]
 
 
 ####################################################################
@@ -699,11 +871,109 @@ class PickleSerializer(object):
         return pickle.dump(obj, file_obj, protocol=-1)
 
 
+class MarshalSerializer(object):
+    """Fast, compact serializer for flat data, built on :mod:`marshal`.
+
+    .. versionadded:: 1.38
+
+    Use this serializer for lists of records, e.g. the result of
+    a ``data_func`` passed to :meth:`Workflow.cached_data`. It is
+    considerably faster than ``cpickle`` at loading such lists, and
+    the files are smaller.
+
+    Only the types :mod:`marshal` supports can be saved, i.e. ``None``,
+    numbers, strings and lists, tuples, sets and dicts of them. As an
+    exception, a list or tuple of :func:`~collections.namedtuple`
+    instances of the same type is saved as plain tuples plus the type's
+    name and fields. It is loaded as a list of instances of an
+    equivalent :func:`~collections.namedtuple` type (not the same
+    class, so don't use :func:`isinstance` on them).
+
+    The data are preceded by a header containing :attr:`version` and
+    the :mod:`marshal` format version. A :class:`ValueError` is raised
+    when loading data with a different header, e.g. data saved by
+    another version of Python.
+
+    """
+
+    #: Identifies data saved by this serializer
+    magic = b'AWMS'
+    #: Version of the file format. Incremented when the format changes.
+    version = 1
+    #: Format of header: magic, format version, marshal version
+    header = struct.Struct(b'>4sBB')
+
+    # Payload types
+    PLAIN = 0
+    RECORDS = 1
+
+    # namedtuple types created by `load`, keyed by (typename, fields)
+    _record_types = {}
+
+    @classmethod
+    def load(cls, file_obj):
+        """Load serialized object from open marshal file.
+
+        .. versionadded:: 1.38
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from file
+        :rtype: object
+
+        """
+        header = file_obj.read(cls.header.size)
+        if header != cls.header.pack(cls.magic, cls.version,
+                                     marshal.version):
+            raise ValueError('Unsupported marshal data: {0!r}'.format(header))
+
+        payload = marshal.loads(file_obj.read())
+        if payload[0] == cls.PLAIN:
+            return payload[1]
+
+        _, typename, fields, rows = payload
+        key = (typename, fields)
+        record_type = cls._record_types.get(key)
+        if record_type is None:
+            record_type = cls._record_types[key] = namedtuple(typename,
+                                                              fields)
+
+        return map(record_type._make, rows)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        """Serialize object ``obj`` to open marshal file.
+
+        .. versionadded:: 1.38
+
+        Raises a :class:`ValueError` if ``obj`` contains unsupported
+        types.
+
+        :param obj: Python object to serialize
+        :type obj: Python object
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        payload = (cls.PLAIN, obj)
+        if (isinstance(obj, (list, tuple)) and obj and
+                hasattr(obj[0], '_fields')):
+            record_type = type(obj[0])
+            if all(type(r) is record_type for r in obj):
+                payload = (cls.RECORDS, record_type.__name__,
+                           tuple(record_type._fields), map(tuple, obj))
+
+        file_obj.write(cls.header.pack(cls.magic, cls.version,
+                                       marshal.version))
+        file_obj.write(marshal.dumps(payload))
+
+
 # Set up default manager and register built-in serializers
 manager = SerializerManager()
 manager.register('cpickle', CPickleSerializer)
 manager.register('pickle', PickleSerializer)
 manager.register('json', JSONSerializer)
+manager.register('marshal', MarshalSerializer)
 
 
 class Item(object):
@@ -815,59 +1085,137 @@ class Settings(dict):
     An appropriate instance is provided by :class:`Workflow` instances at
     :attr:`Workflow.settings`.
 
+    .. versionchanged:: 1.38
+
+    Every change rewrites the whole file, so change several settings
+    inside a :meth:`transaction` to write them all at once::
+
+        with wf.settings.transaction():
+            wf.settings['user'] = user
+            wf.settings['token'] = token
+
+    While :meth:`Workflow.run` is running, :attr:`write_behind` is on,
+    so changes are written once, when the workflow has run.
+
     """
 
     def __init__(self, filepath, defaults=None):
         """Create new :class:`Settings` object."""
         super(Settings, self).__init__()
         self._filepath = filepath
-        self._nosave = False
-        self._original = {}
+        # Contents of settings file as last read or written
+        self._serialized = None
+        # Depth of nested transactions
+        self._transactions = 0
+        # Whether there are changes that haven't been written yet
+        self._dirty = False
+        #: Don't write changes until :meth:`flush` is called.
+        #:
+        #: .. versionadded:: 1.38
+        self.write_behind = False
         if os.path.exists(self._filepath):
             self._load()
         elif defaults:
-            for key, val in defaults.items():
-                self[key] = val
-            self.save()  # save default settings
+            with self.transaction():
+                for key, val in defaults.items():
+                    self[key] = val
+                self.save()  # save default settings
 
     def _load(self):
         """Load cached settings from JSON file `self._filepath`."""
-        data = {}
         with LockFile(self._filepath, 0.5):
             with open(self._filepath, 'rb') as fp:
-                data.update(json.load(fp))
-
-        self._original = deepcopy(data)
+                self._serialized = fp.read()
 
-        self._nosave = True
-        self.update(data)
-        self._nosave = False
+        super(Settings, self).update(json.loads(self._serialized))
 
-    @uninterruptible
     def save(self):
         """Save settings to JSON file specified in ``self._filepath``.
 
         If you're using this class via :attr:`Workflow.settings`, which
         you probably are, ``self._filepath`` will be ``settings.json``
         in your workflow's data directory (see :attr:`~Workflow.datadir`).
+
+        .. versionchanged:: 1.38
+
+        Inside a :meth:`transaction` or with :attr:`write_behind` on,
+        the settings are only marked as changed. Use :meth:`flush`
+        to write them immediately. The file is only rewritten if its
+        contents would change.
+
         """
-        if self._nosave:
+        if self._transactions or self.write_behind:
+            self._dirty = True
             return
 
+        self._write()
+
+    @uninterruptible
+    def _write(self):
+        """Write settings to disk if they've changed."""
+        self._dirty = False
         data = {}
         data.update(self)
 
+        serialized = json.dumps(data, sort_keys=True, indent=2,
+                                encoding='utf-8')
+        if serialized == self._serialized:
+            return
+
         with LockFile(self._filepath, 0.5):
             with atomic_writer(self._filepath, 'wb') as fp:
-                json.dump(data, fp, sort_keys=True, indent=2,
-                          encoding='utf-8')
+                fp.write(serialized)
+
+        self._serialized = serialized
+
+    def flush(self):
+        """Write pending changes to disk.
+
+        .. versionadded:: 1.38
+
+        Called at the end of a :meth:`transaction` and by
+        :meth:`Workflow.run` when the workflow has run. Call it
+        yourself if another process (e.g. a background job) needs
+        the changes before then.
+
+        """
+        if self._dirty:
+            self._write()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that writes all changes made in it at once.
+
+        .. versionadded:: 1.38
+
+        Transactions may be nested. The changes are written when the
+        outermost one exits, even if its block raises an exception
+        (just as they would have been without the transaction).
+
+        """
+        self._transactions += 1
+        try:
+            yield self
+        finally:
+            self._transactions -= 1
+            if not self._transactions and not self.write_behind:
+                self.flush()
 
     # dict methods
     def __setitem__(self, key, value):
-        """Implement :class:`dict` interface."""
-        if self._original.get(key) != value:
-            super(Settings, self).__setitem__(key, value)
-            self.save()
+        """Implement :class:`dict` interface.
+
+        Setting a key to an equal value doesn't save the settings.
+        Setting it to the object it already holds does, as the object
+        may have been modified.
+        """
+        current = self.get(key, UNSET)
+        if current is not value and type(current) is type(value) \
+                and current == value:
+            return
+
+        super(Settings, self).__setitem__(key, value)
+        self.save()
 
     def __delitem__(self, key):
         """Implement :class:`dict` interface."""
@@ -876,14 +1224,140 @@ class Settings(dict):
 
     def update(self, *args, **kwargs):
         """Override :class:`dict` method to save on update."""
-        super(Settings, self).update(*args, **kwargs)
-        self.save()
+        with self.transaction():
+            for key, value in dict(*args, **kwargs).items():
+                self[key] = value
 
     def setdefault(self, key, value=None):
         """Override :class:`dict` method to save on update."""
-        ret = super(Settings, self).setdefault(key, value)
-        self.save()
-        return ret
+        if key not in self:
+            self[key] = value
+        return self[key]
+
+
+class CachePolicy(object):
+    """How a cache key is generated and how long it's fresh.
+
+    .. versionadded:: 1.38
+
+    Register policies with :meth:`Workflow.register_cache_policy` and
+    get the data with :meth:`Workflow.cached`. See the former for the
+    meaning of the attributes.
+
+    """
+
+    def __init__(self, refresher, ttl=60, soft_ttl=0, session=False,
+                 records=False, compression=0, invalidates=()):
+        """Create new :class:`CachePolicy`."""
+        self.refresher = refresher
+        self.ttl = ttl
+        self.soft_ttl = soft_ttl
+        self.session = session
+        self.records = records
+        self.compression = compression
+        self.invalidates = tuple(invalidates)
+
+    def __repr__(self):
+        """Format policy for logging."""
+        return ('CachePolicy(ttl={0!r}, soft_ttl={1!r}, session={2!r}, '
+                'records={3!r})'.format(self.ttl, self.soft_ttl,
+                                        self.session, self.records))
+
+
+class FilterStats(object):
+    """How many items each stage of :meth:`Workflow.filter` rejected.
+
+    .. versionadded:: 1.38
+
+    Returned by :meth:`Workflow.filter` if ``stats`` is ``True``.
+    Use it to see which rules actually match a given dataset, e.g.
+    to choose the ``match_on`` flags.
+
+    Each stage only sees the items that passed the stages before it:
+
+    ``index``
+        Items excluded by the search index.
+    ``empty``
+        Items with an empty search key.
+    ``charset``
+        Items that don't contain all the characters of the query.
+    ``startswith``, ``capitals``, ``atom``, ``initials_startswith``, ``initials_contain``, ``substring``, ``allchars``
+        Items not matched by the ``MATCH_*`` rule (only rules in
+        ``match_on``). Items rejected by the last rule matched no rule
+        at all. For multi-word queries, an item counts as matched by the
+        rule that matched its last word.
+    ``min_score``
+        Items whose score was not above ``min_score``.
+    ``max_results``
+        Items beyond ``max_results``.
+
+    """
+
+    #: ``MATCH_*`` rules and their stage names, in order
+    RULES = [
+        (MATCH_STARTSWITH, 'startswith'),
+        (MATCH_CAPITALS, 'capitals'),
+        (MATCH_ATOM, 'atom'),
+        (MATCH_INITIALS_STARTSWITH, 'initials_startswith'),
+        (MATCH_INITIALS_CONTAIN, 'initials_contain'),
+        (MATCH_SUBSTRING, 'substring'),
+        (MATCH_ALLCHARS, 'allchars'),
+    ]
+
+    def __init__(self):
+        """Create new, empty :class:`FilterStats`."""
+        #: Number of items filtered
+        self.items = 0
+        #: Number of items returned
+        self.results = 0
+        #: Number of items rejected by each stage, in order
+        self.rejected = OrderedDict()
+        #: Seconds spent getting search keys (``keys``), folding them
+        #: (``fold``), in the index, ``charset`` and ``min_score`` stages,
+        #: scoring (``score``), weighting (``weight``) and sorting
+        #: (``sort``) results
+        self.times = OrderedDict()
+
+    def add(self, stage, rejected=None, elapsed=None):
+        """Add rejected items and/or elapsed time to ``stage``.
+
+        :param stage: name of stage
+        :type stage: ``unicode``
+        :param rejected: number of items rejected
+        :type rejected: ``int``
+        :param elapsed: seconds spent
+        :type elapsed: ``float``
+
+        """
+        if rejected is not None:
+            self.rejected[stage] = self.rejected.get(stage, 0) + rejected
+        if elapsed is not None:
+            self.times[stage] = self.times.get(stage, 0.0) + elapsed
+
+    def add_rules(self, match_on, scored, matched):
+        """Add rejections of ``MATCH_*`` rules.
+
+        :param match_on: rules used
+        :type match_on: ``int``
+        :param scored: number of items that were scored
+        :type scored: ``int``
+        :param matched: mapping of rules to the number of items they matched
+        :type matched: ``dict``
+
+        """
+        for rule, name in self.RULES:
+            if match_on & rule:
+                scored -= matched.get(rule, 0)
+                self.add(name, scored)
+
+    def __str__(self):
+        """Format stats for log."""
+        rejected = ' '.join(['{0}={1}'.format(k, v)
+                             for k, v in self.rejected.items()])
+        times = ' '.join(['{0}={1:0.1f}ms'.format(k, v * 1000)
+                          for k, v in self.times.items()])
+        return '{0} items -> {1} results, rejected: {2}, time: {3}'.format(
+            self.items, self.results, rejected, times)
 
 
 class Workflow(object):
@@ -950,10 +1424,14 @@ class Workflow(object):
         self._workflowdir = None
         self._settings_path = None
         self._settings = None
+        # Whether `run()` is running. Changes to settings are
+        # written when it's finished.
+        self._running = False
         self._bundleid = None
         self._debugging = None
         self._name = None
         self._cache_serializer = 'cpickle'
+        self._cache_backend = None
         self._data_serializer = 'cpickle'
         self._info = None
         self._info_loaded = False
@@ -981,6 +1459,40 @@ class Workflow(object):
         #: By default, the magic arguments documented
         #: :ref:`here <magic-arguments>` are registered.
         self.magic_arguments = {}
+        #: Minimum number of items :meth:`filter` scores in a process
+        #: pool. The default (``None``) means the threshold is worked out
+        #: from how long it takes to start a pool, to score an item and
+        #: to pickle the data sent to and from the pool, so parallel
+        #: scoring is only used when it's faster. Set to ``0``
+        #: to always score items in the current process.
+        self.parallel_filter_threshold = None
+        #: Maximum size of :attr:`cachedir` in bytes. If set, the least
+        #: recently used cached data are deleted in the background when
+        #: the cache grows larger (see :meth:`check_cache_size`).
+        #: The default (``None``) means no limit.
+        self.cache_max_bytes = None
+        #: Record hits and misses of :meth:`cached_data` and
+        #: :meth:`cached_records` for each key. Show them in Alfred with
+        #: the ``workflow:cachestats`` magic argument. They're saved
+        #: when :meth:`run` finishes.
+        self.record_cache_stats = False
+        # Lookups not yet saved to `cache_stats_file`
+        self._cache_stats = []
+        #: Function called with the :class:`Workflow` instance in a
+        #: background process to fill caches when :attr:`first_run`
+        #: is true or a run regenerated cached data. See
+        #: :meth:`warm_caches`.
+        self.cache_warmer = None
+        # Whether `cached_data()` or `cached_records()` regenerated data
+        self._cache_missed = False
+        #: Namespace of cached data, e.g. the version of their format
+        #: or :attr:`version`. Data cached in other namespaces are
+        #: ignored, and deleted in the background by
+        #: :meth:`check_cache_namespace`. Must not contain ``@``.
+        self.cache_namespace = None
+        #: Mapping of cache keys to :class:`CachePolicy` objects.
+        #: Add policies with :meth:`register_cache_policy`.
+        self.cache_policies = {}
 
         self._register_default_magic()
 
@@ -1464,10 +1976,11 @@ class Workflow(object):
         :rtype: :class:`~workflow.workflow.Settings` instance
 
         """
-        if not self._settings:
+        if self._settings is None:
             self.logger.debug('reading settings from %s', self.settings_path)
             self._settings = Settings(self.settings_path,
                                       self._default_settings)
+            self._settings.write_behind = self._running
         return self._settings
 
     @property
@@ -1513,6 +2026,63 @@ class Workflow(object):
 
         self._cache_serializer = serializer_name
 
+    @property
+    def cache_backend(self):
+        """Storage backend for cached data.
+
+        .. versionadded:: 1.38
+
+        This backend is used by :meth:`cache_data()`, :meth:`cached_data()`
+        and :meth:`cached_data_age()`, but not by :meth:`cached_records()`,
+        which memory-maps its files, so always saves records to files
+        in :attr:`cachedir`.
+
+        The default is :class:`~workflow.cache.FileCache`, which saves each
+        key to its own file, unless the ``_WF_CACHE_BACKEND`` environment
+        variable names a different backend.
+
+        See :mod:`workflow.cache` for details.
+
+        :returns: cache backend
+        :rtype: :class:`~workflow.cache.FileCache` or similar
+
+        """
+        if self._cache_backend is None:
+            name = os.getenv('_WF_CACHE_BACKEND') or 'file'
+            self._cache_backend = CACHE_BACKENDS[name](self.cachedir, manager)
+
+        return self._cache_backend
+
+    @cache_backend.setter
+    def cache_backend(self, backend):
+        """Set the cache backend.
+
+        .. versionadded:: 1.38
+
+        ``backend`` may be an instance or the name of a backend in
+        :data:`workflow.cache.BACKENDS`, otherwise a :class:`ValueError`
+        will be raised.
+
+        Setting the backend by name also sets ``_WF_CACHE_BACKEND``, so
+        processes started by the workflow, e.g. with
+        :func:`~workflow.background.run_in_background`, use the same one.
+
+        :param backend: Backend or name of backend
+        :type backend: ``unicode`` or object
+
+        """
+        if isinstance(backend, basestring):
+            if backend not in CACHE_BACKENDS:
+                raise ValueError('Unknown cache backend : `{0}`'.format(
+                                 backend))
+
+            os.environ[b'_WF_CACHE_BACKEND'] = backend.encode('utf-8')
+            backend = CACHE_BACKENDS[backend](self.cachedir, manager)
+
+        self.logger.debug('cache backend: %s', backend.__class__.__name__)
+
+        self._cache_backend = backend
+
     @property
     def data_serializer(self):
         """Name of default data serializer.
@@ -1595,17 +2165,20 @@ class Workflow(object):
             return None
 
         with open(data_path, 'rb') as file_obj:
-            data = serializer.load(file_obj)
+            data = load_data(serializer, file_obj)
 
         self.logger.debug('stored data loaded: %s', data_path)
 
         return data
 
-    def store_data(self, name, data, serializer=None):
+    def store_data(self, name, data, serializer=None, compression=0):
         """Save data to data directory.
 
         .. versionadded:: 1.8
 
+        .. versionchanged:: 1.38
+            Added ``compression``.
+
         If ``data`` is ``None``, the datastore will be deleted.
 
         Note that the datastore does NOT support mutliple threads.
@@ -1616,6 +2189,10 @@ class Workflow(object):
         :param serializer: name of serializer to use. If no serializer
             is specified, the default will be used. See
             :class:`SerializerManager` for more information.
+        :param compression: zlib compression level (1-9) to compress
+            the data with. The default (``0``) is no compression.
+            :meth:`stored_data` decompresses data automatically.
+        :type compression: ``int``
         :returns: data in datastore or ``None``
 
         """
@@ -1662,72 +2239,124 @@ class Workflow(object):
                 file_obj.write(serializer_name)
 
             with atomic_writer(data_path, 'wb') as file_obj:
-                serializer.dump(data, file_obj)
+                dump_data(serializer, data, file_obj, compression)
 
         _store()
 
         self.logger.debug('saved data: %s', data_path)
 
-    def cached_data(self, name, data_func=None, max_age=60):
+    def cached_data(self, name, data_func=None, max_age=60, compression=0):
         """Return cached data if younger than ``max_age`` seconds.
 
         Retrieve data from cache or re-generate and re-cache data if
         stale/non-existant. If ``max_age`` is 0, return cached data no
         matter how old.
 
+        .. versionchanged:: 1.38
+
+        Only one process at a time calls ``data_func`` for the same
+        ``name``. If another process is already regenerating the data,
+        stale data are returned if there are any. Otherwise, this
+        method waits up to :data:`CACHE_LOCK_TIMEOUT` seconds for the
+        other process to finish and returns the data it cached.
+
         :param name: name of datastore
         :param data_func: function to (re-)generate data.
         :type data_func: ``callable``
         :param max_age: maximum age of cached data in seconds
         :type max_age: ``int``
+        :param compression: compression level to cache the return value
+            of ``data_func`` with. See :meth:`cache_data`.
+        :type compression: ``int``
         :returns: cached data, return value of ``data_func`` or ``None``
             if ``data_func`` is not set
 
         """
-        serializer = manager.serializer(self.cache_serializer)
-
-        cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
-        age = self.cached_data_age(name)
-
-        if (age < max_age or max_age == 0) and os.path.exists(cache_path):
-
-            with open(cache_path, 'rb') as file_obj:
-                self.logger.debug('loading cached data: %s', cache_path)
-                return serializer.load(file_obj)
+        key = self._cache_key(name)
+        data, age = self.cache_backend.load_with_age(
+            key, self.cache_serializer, max_age)
+        if data is not None:
+            self.logger.debug('loaded cached data: %s', name)
+            if self.record_cache_stats:
+                self._record_cache_stat(name, 'hit', age=age)
+            return data
 
         if not data_func:
             return None
 
-        data = data_func()
-        self.cache_data(name, data)
+        # Ensure only one process regenerates the data
+        path = self.cachefile('%s.%s' % (key, self.cache_serializer))
+        lock = LockFile(path, CACHE_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            data, age = self.cache_backend.load_with_age(
+                key, self.cache_serializer)
+            if data is not None:
+                self.logger.debug('loaded stale cached data: %s', name)
+                if self.record_cache_stats:
+                    self._record_cache_stat(name, 'stale', age=age)
+                return data
+
+            self.logger.debug('waiting for cached data: %s', name)
+            try:
+                lock.acquire()
+            except AcquisitionError:
+                self.logger.warning('timed out waiting for cached data: %s',
+                                    name)
+
+        try:
+            # Another process may have cached the data
+            # while we were waiting for the lock
+            data = self.cache_backend.load(key, self.cache_serializer,
+                                           max_age)
+            if data is not None:
+                self.logger.debug('loaded cached data: %s', name)
+                if self.record_cache_stats:
+                    self._record_cache_stat(name, 'wait')
+                return data
+
+            start = time.time()
+            data = data_func()
+            elapsed = time.time() - start
+            self.cache_data(name, data, compression=compression)
+            self._cache_missed = True
+            if self.record_cache_stats:
+                self._record_cache_stat(name, 'miss', elapsed=elapsed)
+        finally:
+            lock.release()
 
         return data
 
-    def cache_data(self, name, data):
+    def cache_data(self, name, data, compression=0):
         """Save ``data`` to cache under ``name``.
 
         If ``data`` is ``None``, the corresponding cache file will be
         deleted.
 
+        .. versionchanged:: 1.38
+            Added ``compression``. If ``data`` are the same as the
+            cached data, only the cache's age is reset.
+
         :param name: name of datastore
         :param data: data to store. This may be any object supported by
                 the cache serializer
+        :param compression: zlib compression level (1-9) to compress
+            the data with. The default (``0``) is no compression.
+            Compressed data are decompressed automatically when loaded.
+            Compression pays for large, repetitive data, such as JSON
+            API responses; see ``bin/bench_compression.py``.
+        :type compression: ``int``
 
         """
-        serializer = manager.serializer(self.cache_serializer)
-
-        cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
+        written = self.cache_backend.save(self._cache_key(name),
+                                          self.cache_serializer, data,
+                                          compression)
 
         if data is None:
-            if os.path.exists(cache_path):
-                os.unlink(cache_path)
-                self.logger.debug('deleted cache file: %s', cache_path)
-            return
-
-        with atomic_writer(cache_path, 'wb') as file_obj:
-            serializer.dump(data, file_obj)
-
-        self.logger.debug('cached data: %s', cache_path)
+            self.logger.debug('deleted cached data: %s', name)
+        elif written is False:
+            self.logger.debug('cached data unchanged: %s', name)
+        else:
+            self.logger.debug('cached data: %s', name)
 
     def cached_data_fresh(self, name, max_age):
         """Whether cache `name` is less than `max_age` seconds old.
@@ -1755,93 +2384,496 @@ class Workflow(object):
         :rtype: ``int``
 
         """
-        cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
+        return self.cache_backend.age(self._cache_key(name),
+                                      self.cache_serializer)
 
-        if not os.path.exists(cache_path):
-            return 0
+    def _cache_key(self, name):
+        """Return backend key of cache ``name`` in :attr:`cache_namespace`.
 
-        return time.time() - os.stat(cache_path).st_mtime
+        Alfred-Workflow's own data (``__workflow_*``) aren't namespaced.
+        """
+        if not self.cache_namespace or name.startswith('__workflow'):
+            return name
+        return '{0}{1}{2}'.format(name, CACHE_NAMESPACE_SEPARATOR,
+                                  self.cache_namespace)
 
-    def filter(self, query, items, key=lambda x: x, ascending=False,
-               include_score=False, min_score=0, max_results=0,
-               match_on=MATCH_ALL, fold_diacritics=True):
-        """Fuzzy search filter. Returns list of ``items`` that match ``query``.
+    def _records_path(self, name):
+        """Return path of :meth:`cached_records` file of cache ``name``."""
+        return self.cachefile(self._cache_key(name) + '.records')
 
-        ``query`` is case-insensitive. Any item that does not contain the
-        entirety of ``query`` is rejected.
+    def cached_records(self, name, data_func=None, max_age=60):
+        """Return cached list of records if younger than ``max_age`` seconds.
 
-        If ``query`` is an empty string or contains only whitespace,
-        all items will match.
+        .. versionadded:: 1.38
 
-        :param query: query to test items against
-        :type query: ``unicode``
-        :param items: iterable of items to test
-        :type items: ``list`` or ``tuple``
-        :param key: function to get comparison key from ``items``.
-            Must return a ``unicode`` string. The default simply returns
-            the item.
-        :type key: ``callable``
-        :param ascending: set to ``True`` to get worst matches first
-        :type ascending: ``Boolean``
-        :param include_score: Useful for debugging the scoring algorithm.
-            If ``True``, results will be a list of tuples
-            ``(item, score, rule)``.
-        :type include_score: ``Boolean``
-        :param min_score: If non-zero, ignore results with a score lower
-            than this.
-        :type min_score: ``int``
-        :param max_results: If non-zero, prune results list to this length.
-        :type max_results: ``int``
-        :param match_on: Filter option flags. Bitwise-combined list of
-            ``MATCH_*`` constants (see below).
-        :type match_on: ``int``
-        :param fold_diacritics: Convert search keys to ASCII-only
-            characters if ``query`` only contains ASCII characters.
-        :type fold_diacritics: ``Boolean``
-        :returns: list of ``items`` matching ``query`` or list of
-            ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
-            ``rule`` is the ``MATCH_*`` rule that matched the item.
-        :rtype: ``list``
+        Like :meth:`cached_data`, but the records returned by
+        ``data_func`` are saved to a ``<name>.records`` file in
+        :attr:`cachedir` (regardless of :attr:`cache_backend`) and
+        returned as a memory-mapped :class:`~workflow.records.RecordTable`.
+        Only the records you access are read from the file, which makes
+        this much faster than :meth:`cached_data` for long lists of which
+        you only need a few records, e.g. the ones that match a query.
 
-        **Matching rules**
+        Only one process at a time calls ``data_func`` for the same
+        ``name``. As with :meth:`cached_data`, other processes return
+        stale records if there are any, or wait up to
+        :data:`CACHE_LOCK_TIMEOUT` seconds for the first one to finish.
 
-        By default, :meth:`filter` uses all of the following flags (i.e.
-        :const:`MATCH_ALL`). The tests are always run in the given order:
+        :param name: name of datastore
+        :param data_func: function to (re-)generate records. It must
+            return a list of tuples or namedtuples (see
+            :class:`~workflow.records.RecordTable`).
+        :type data_func: ``callable``
+        :param max_age: maximum age of cached records in seconds.
+            ``0`` means no limit.
+        :type max_age: ``int``
+        :returns: :class:`~workflow.records.RecordTable` or ``None``
+            if there are no (fresh) records and ``data_func`` is not set
 
-        1. :const:`MATCH_STARTSWITH`
-            Item search key starts with ``query`` (case-insensitive).
-        2. :const:`MATCH_CAPITALS`
-            The list of capital letters in item search key starts with
-            ``query`` (``query`` may be lower-case). E.g., ``of``
-            would match ``OmniFocus``, ``gc`` would match ``Google Chrome``.
-        3. :const:`MATCH_ATOM`
-            Search key is split into "atoms" on non-word characters
-            (.,-,' etc.). Matches if ``query`` is one of these atoms
-            (case-insensitive).
-        4. :const:`MATCH_INITIALS_STARTSWITH`
-            Initials are the first characters of the above-described
-            "atoms" (case-insensitive).
-        5. :const:`MATCH_INITIALS_CONTAIN`
-            ``query`` is a substring of the above-described initials.
-        6. :const:`MATCH_INITIALS`
-            Combination of (4) and (5).
-        7. :const:`MATCH_SUBSTRING`
-            ``query`` is a substring of item search key (case-insensitive).
-        8. :const:`MATCH_ALLCHARS`
-            All characters in ``query`` appear in item search key in
-            the same order (case-insensitive).
-        9. :const:`MATCH_ALL`
-            Combination of all the above.
+        """
+        path = self._records_path(name)
+
+        def _load(max_age=max_age):
+            """Return ``(table, age)`` or ``(None, 0)``."""
+            try:
+                age = time.time() - os.stat(path).st_mtime
+            except OSError:
+                return None, 0
+
+            if max_age and age >= max_age:
+                return None, 0
+
+            try:
+                return RecordTable(path), age
+            except ValueError as err:  # old format
+                self.logger.warning(err)
+                return None, 0
+
+        table, age = _load()
+        if table is not None:
+            self.logger.debug('loaded cached records: %s', name)
+            if self.record_cache_stats:
+                self._record_cache_stat(name, 'hit', age=age)
+            return table
 
+        if not data_func:
+            return None
 
-        :const:`MATCH_ALLCHARS` is considerably slower than the other
-        tests and provides much less accurate results.
+        # Ensure only one process regenerates the records
+        lock = LockFile(path, CACHE_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            table, age = _load(max_age=0)
+            if table is not None:
+                self.logger.debug('loaded stale cached records: %s', name)
+                if self.record_cache_stats:
+                    self._record_cache_stat(name, 'stale', age=age)
+                return table
+
+            self.logger.debug('waiting for cached records: %s', name)
+            try:
+                lock.acquire()
+            except AcquisitionError:
+                self.logger.warning('timed out waiting for cached records: '
+                                    '%s', name)
 
-        **Examples:**
+        try:
+            # Another process may have cached the records
+            # while we were waiting for the lock
+            table, _ = _load()
+            if table is not None:
+                if self.record_cache_stats:
+                    self._record_cache_stat(name, 'wait')
+                return table
+
+            start = time.time()
+            RecordTable.write(path, data_func())
+            self._cache_missed = True
+            if self.record_cache_stats:
+                self._record_cache_stat(name, 'miss',
+                                        elapsed=time.time() - start)
+            self.logger.debug('cached records: %s', name)
+            table = RecordTable(path)
+        finally:
+            lock.release()
 
-        To ignore :const:`MATCH_ALLCHARS` (tends to provide the worst
-        matches and is expensive to run), use
-        ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
+        return table
+
+    @property
+    def cache_stats_file(self):
+        """Path to file :attr:`record_cache_stats` saves statistics in.
+
+        .. versionadded:: 1.38
+
+        Each line records one lookup: time, outcome (``hit``,
+        ``stale``, ``wait`` or ``miss``), seconds spent regenerating
+        the data, age of the data in seconds and the cache key,
+        separated by tabs. The file is rotated at
+        :data:`CACHE_STATS_MAX_BYTES`.
+
+        """
+        return self.cachefile('__workflow_cachestats.log')
+
+    def _record_cache_stat(self, name, outcome, age=0, elapsed=0):
+        """Add lookup of cache ``name`` to the unsaved statistics."""
+        self._cache_stats.append(
+            '{0:.0f}\t{1}\t{2:.3f}\t{3:.0f}\t{4}\n'.format(
+                time.time(), outcome, elapsed, age, name))
+
+    def save_cache_stats(self):
+        """Append recorded lookups to :attr:`cache_stats_file`.
+
+        .. versionadded:: 1.38
+
+        Called by :meth:`run` when your workflow has run.
+
+        """
+        if not self._cache_stats:
+            return
+
+        path = self.cache_stats_file
+        lines, self._cache_stats = self._cache_stats, []
+        with LockFile(path, 0.5):
+            try:
+                if os.path.getsize(path) > CACHE_STATS_MAX_BYTES:
+                    os.rename(path, path + '.1')
+            except OSError:  # doesn't exist
+                pass
+
+            with open(path, 'ab') as fp:
+                fp.write(''.join(lines).encode('utf-8'))
+
+    def cache_stats(self):
+        """Summarise the lookups recorded in :attr:`cache_stats_file`.
+
+        .. versionadded:: 1.38
+
+        Keys of session-scoped caches are combined, so all sessions'
+        lookups of a key are counted together.
+
+        :returns: mapping of cache keys to dicts with the keys ``hit``,
+            ``stale``, ``wait`` and ``miss`` (number of lookups with
+            that outcome), ``regenerate`` (total seconds spent
+            regenerating data) and ``age`` (total age in seconds of
+            data returned by ``hit`` and ``stale`` lookups)
+        :rtype: ``dict``
+
+        """
+        stats = {}
+        path = self.cache_stats_file
+        for filepath in (path + '.1', path):
+            if not os.path.exists(filepath):
+                continue
+
+            with open(filepath, 'rb') as fp:
+                for line in fp:
+                    try:
+                        _, outcome, elapsed, age, name = line.decode(
+                            'utf-8').rstrip('\n').split('\t', 4)
+                        elapsed, age = float(elapsed), float(age)
+                    except ValueError:  # partially-written line
+                        continue
+
+                    name = SESSION_PREFIX.sub('', name)
+                    if name not in stats:
+                        stats[name] = dict(hit=0, stale=0, wait=0, miss=0,
+                                           regenerate=0.0, age=0.0)
+                    d = stats[name]
+                    d[outcome] = d.get(outcome, 0) + 1
+                    d['regenerate'] += elapsed
+                    d['age'] += age
+
+        return stats
+
+    def register_cache_policy(self, name, refresher, ttl=60, soft_ttl=0,
+                              session=False, records=False, compression=0,
+                              invalidates=()):
+        """Declare how cache ``name`` is generated and when it expires.
+
+        .. versionadded:: 1.38
+
+        Get the data with :meth:`cached`. If they are older than
+        ``soft_ttl``, the cached data are returned and ``refresher`` is
+        called in a background process to renew them, so callers only
+        wait for ``refresher`` if the data are missing or older than
+        ``ttl``.
+
+        The background process runs your workflow's script again with
+        the ``_WF_CACHE_REFRESH`` environment variable set to ``name``.
+        :meth:`run` then refreshes the cache instead of calling your
+        main function, so policies must be registered *before*
+        :meth:`run` is called::
+
+            wf = Workflow3()
+            wf.register_cache_policy('servers', fetch_servers,
+                                     ttl=3600, soft_ttl=600)
+            sys.exit(wf.run(main))
+
+        :param name: name of datastore
+        :type name: ``unicode``
+        :param refresher: function that returns fresh data
+        :type refresher: ``callable``
+        :param ttl: maximum age of data in seconds. ``0`` means they
+            never expire.
+        :type ttl: ``int``
+        :param soft_ttl: age in seconds after which data are refreshed
+            in the background. ``0`` means never.
+        :type soft_ttl: ``int``
+        :param session: cache data only for the current session
+            (:class:`~workflow.Workflow3` only)
+        :type session: ``bool``
+        :param records: cache data with :meth:`cached_records`
+            instead of :meth:`cached_data`
+        :type records: ``bool``
+        :param compression: compression level. See :meth:`cache_data`.
+        :type compression: ``int``
+        :param invalidates: names of caches (with the same ``session``)
+            derived from this one. They are deleted when a background
+            refresh changes the data.
+        :type invalidates: ``list``
+
+        """
+        self.cache_policies[name] = CachePolicy(
+            refresher, ttl, soft_ttl, session, records, compression,
+            invalidates)
+
+    def cached(self, name):
+        """Return data of cache ``name``, generating them if necessary.
+
+        .. versionadded:: 1.38
+
+        The cache's :class:`CachePolicy` must have been registered
+        with :meth:`register_cache_policy`.
+
+        :param name: name of datastore
+        :type name: ``unicode``
+        :returns: cached data or return value of policy's ``refresher``
+
+        """
+        policy = self.cache_policies[name]
+        key = self._policy_key(name, policy)
+        if policy.records:
+            data = self.cached_records(key, policy.refresher, policy.ttl)
+        else:
+            data = self.cached_data(key, policy.refresher, policy.ttl,
+                                    compression=policy.compression)
+
+        if policy.soft_ttl and self._policy_age(key, policy) > policy.soft_ttl:
+            self.refresh_cache(name)
+
+        return data
+
+    def refresh_cache(self, name):
+        """Regenerate cache ``name`` in the background.
+
+        .. versionadded:: 1.38
+
+        Called by :meth:`cached` when data are older than their
+        policy's ``soft_ttl``. Does nothing if a refresh of ``name``
+        is already running.
+
+        :param name: name of a datastore with a :class:`CachePolicy`
+        :type name: ``unicode``
+
+        """
+        self.logger.debug('refreshing cache in background: %s', name)
+        self._rerun_in_background('__workflow_refresh-' + name,
+                                  _WF_CACHE_REFRESH=name)
+
+    def warm_caches(self):
+        """Call :attr:`cache_warmer` in the background.
+
+        .. versionadded:: 1.38
+
+        Called by :meth:`run` after your workflow has run if
+        :attr:`first_run` is true or the run had to regenerate expired
+        or missing cached data, so the other caches are filled while
+        the user is still typing. It's called after the workflow, so
+        the warmer doesn't compete with it for the caches' locks.
+        A background refresh started by :meth:`cached` calls
+        :attr:`cache_warmer` itself after replacing stale data, so
+        caches that depend on them are rebuilt before they're needed.
+
+        Caches scoped to a :attr:`~workflow.Workflow3.session_id` can't
+        be filled before the session starts, so the first run of
+        a session still generates any it needs itself.
+
+        Like :meth:`refresh_cache`, it runs your workflow's script again
+        (with the ``_WF_CACHE_WARM`` environment variable set), so
+        :attr:`cache_warmer` must be set *before* :meth:`run` is called.
+        Does nothing if the warmer is already running.
+
+        """
+        if not self.cache_warmer:
+            return
+
+        self.logger.debug('warming caches in background ...')
+        self._rerun_in_background('__workflow_warm', _WF_CACHE_WARM='1')
+
+    def _cache_warm_needed(self):
+        """Whether :meth:`run` should call :meth:`warm_caches`."""
+        return self._cache_missed or (bool(self.version) and self.first_run)
+
+    def _rerun_in_background(self, jobname, **variables):
+        """Run workflow script as background job with extra ``variables``.
+
+        The job uses the current session's cache (if any).
+        """
+        from background import run_in_background
+
+        env = dict(os.environ)
+        for k, v in variables.items():
+            env[k.encode('utf-8')] = v.encode('utf-8')
+        # Use the right session's cache
+        session_id = getattr(self, 'session_id', None)
+        if session_id:
+            env[b'_WF_SESSION_ID'] = session_id.encode('utf-8')
+
+        cmd = ['/usr/bin/python', os.path.abspath(sys.argv[0])]
+        run_in_background(jobname, cmd, env=env, cwd=self.workflowdir)
+
+    def _refresh_cached(self, name):
+        """Call refresher of cache ``name`` and save the result."""
+        policy = self.cache_policies.get(name)
+        if policy is None:
+            raise ValueError('No cache policy registered for `{0}`'.format(
+                             name))
+
+        key = self._policy_key(name, policy)
+        data = policy.refresher()
+        if policy.records:
+            changed = RecordTable.write(self._records_path(key), data)
+        else:
+            changed = self.cache_backend.save(self._cache_key(key),
+                                              self.cache_serializer, data,
+                                              policy.compression)
+
+        self.logger.debug('refreshed cache (changed=%r): %s', changed, name)
+        if changed is not False:
+            for dep in policy.invalidates:
+                self.cache_data(self._policy_key(dep, policy), None)
+
+            # Rebuild the caches deleted above before they're needed
+            if policy.invalidates and self.cache_warmer:
+                self.cache_warmer(self)
+
+    def _policy_key(self, name, policy):
+        """Return cache key for ``name`` according to ``policy``."""
+        if policy.session:
+            raise ValueError('Session-scoped caches require Workflow3')
+        return name
+
+    def _policy_age(self, key, policy):
+        """Return age of cache ``key`` in seconds."""
+        if not policy.records:
+            return self.cached_data_age(key)
+
+        try:
+            return time.time() - os.stat(self._records_path(key)).st_mtime
+        except OSError:
+            return 0
+
+    def filter(self, query, items, key=lambda x: x, ascending=False,
+               include_score=False, min_score=0, max_results=0,
+               match_on=MATCH_ALL, fold_diacritics=True, index=None,
+               stats=False, weight=None, fields=None, deadline_ms=0):
+        """Fuzzy search filter. Returns list of ``items`` that match ``query``.
+
+        ``query`` is case-insensitive. Any item that does not contain the
+        entirety of ``query`` is rejected.
+
+        If ``query`` is an empty string or contains only whitespace,
+        all items will match.
+
+        :param query: query to test items against
+        :type query: ``unicode``
+        :param items: iterable of items to test
+        :type items: ``list`` or ``tuple``
+        :param key: function to get comparison key from ``items``.
+            Must return a ``unicode`` string. The default simply returns
+            the item.
+        :type key: ``callable``
+        :param ascending: set to ``True`` to get worst matches first
+        :type ascending: ``Boolean``
+        :param include_score: Useful for debugging the scoring algorithm.
+            If ``True``, results will be a list of tuples
+            ``(item, score, rule)``.
+        :type include_score: ``Boolean``
+        :param min_score: If non-zero, ignore results with a score lower
+            than this.
+        :type min_score: ``int``
+        :param max_results: If non-zero, prune results list to this length.
+        :type max_results: ``int``
+        :param match_on: Filter option flags. Bitwise-combined list of
+            ``MATCH_*`` constants (see below).
+        :type match_on: ``int``
+        :param fold_diacritics: Convert search keys to ASCII-only
+            characters if ``query`` only contains ASCII characters.
+        :type fold_diacritics: ``Boolean``
+        :param index: Index of the search keys of ``items`` used to
+            narrow down the items that have to be scored. See
+            :ref:`below <filter-index>`.
+        :type index: :class:`~workflow.index.TrigramIndex`
+        :param stats: Also return a :class:`FilterStats` with the number
+            of items each stage of the filter rejected and the time spent.
+            The stats are also written to the debug log.
+        :type stats: ``Boolean``
+        :param weight: Function that returns a factor to multiply an
+            item's score by, e.g. to rank frequently-used items higher.
+            Called with each matching item. See
+            :class:`~workflow.frecency.Frecency`.
+        :type weight: ``callable``
+        :param fields: Search several keys of each item instead of ``key``.
+            See :ref:`below <filter-fields>`.
+        :type fields: ``list`` of ``(key, weight, match_on)`` tuples
+        :param deadline_ms: If non-zero, stop scoring after this many
+            milliseconds and return the best results so far. See
+            :ref:`below <filter-deadline>`.
+        :type deadline_ms: ``int``
+        :returns: list of ``items`` matching ``query`` or list of
+            ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
+            ``rule`` is the ``MATCH_*`` rule that matched the item.
+            If ``stats`` is ``True``, a ``(results, stats)`` tuple.
+        :rtype: ``list`` or ``tuple``
+
+        **Matching rules**
+
+        By default, :meth:`filter` uses all of the following flags (i.e.
+        :const:`MATCH_ALL`). The tests are always run in the given order:
+
+        1. :const:`MATCH_STARTSWITH`
+            Item search key starts with ``query`` (case-insensitive).
+        2. :const:`MATCH_CAPITALS`
+            The list of capital letters in item search key starts with
+            ``query`` (``query`` may be lower-case). E.g., ``of``
+            would match ``OmniFocus``, ``gc`` would match ``Google Chrome``.
+        3. :const:`MATCH_ATOM`
+            Search key is split into "atoms" on non-word characters
+            (.,-,' etc.). Matches if ``query`` is one of these atoms
+            (case-insensitive).
+        4. :const:`MATCH_INITIALS_STARTSWITH`
+            Initials are the first characters of the above-described
+            "atoms" (case-insensitive).
+        5. :const:`MATCH_INITIALS_CONTAIN`
+            ``query`` is a substring of the above-described initials.
+        6. :const:`MATCH_INITIALS`
+            Combination of (4) and (5).
+        7. :const:`MATCH_SUBSTRING`
+            ``query`` is a substring of item search key (case-insensitive).
+        8. :const:`MATCH_ALLCHARS`
+            All characters in ``query`` appear in item search key in
+            the same order (case-insensitive).
+        9. :const:`MATCH_ALL`
+            Combination of all the above.
+
+
+        :const:`MATCH_ALLCHARS` is considerably slower than the other
+        tests and provides much less accurate results.
+
+        **Examples:**
+
+        To ignore :const:`MATCH_ALLCHARS` (tends to provide the worst
+        matches and is expensive to run), use
+        ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
 
         To match only on capitals, use ``match_on=MATCH_CAPITALS``.
 
@@ -1862,38 +2894,395 @@ class Workflow(object):
         If ``query`` contains non-ASCII characters, search keys will not be
         altered.
 
+        .. _filter-index:
+
+        **Search index**
+
+        .. versionadded:: 1.38
+
+        Normally, every item is tested against ``query``. For large
+        lists, pass a :class:`~workflow.index.TrigramIndex` built from
+        the items' search keys as ``index``, and only items that contain
+        all three-character substrings of the query will be scored.
+
+        The index is only used for query words of three or more ASCII
+        characters, and only if ``fold_diacritics`` is ``True`` and
+        ``match_on`` doesn't include :const:`MATCH_ALLCHARS` (which
+        can't be indexed). Results are the same with or without an index.
+        An index that wasn't built from ``items`` (e.g. a cached index
+        of an older list) is ignored with a warning. Checking needs the
+        key of every item unless the index was built with the
+        ``digest`` of ``items``. See :class:`~workflow.index.TrigramIndex`.
+
+        .. _filter-fields:
+
+        **Multiple fields**
+
+        .. versionadded:: 1.38
+
+        To search more than one attribute of the items, e.g. the name and
+        hostname of a server, pass a list of ``(key, weight, match_on)``
+        tuples as ``fields``. ``key`` and ``match_on`` are as above, and
+        ``key`` may return an empty string if an item has no such field.
+        Each field's keys are only computed once per call.
+
+        Every word of ``query`` is scored against each field and the
+        highest score multiplied by the field's ``weight`` counts, so
+        different words may match different fields. The first field
+        is used to sort items with the same score. ``rule`` is the rule
+        that matched the last word.
+
+        With ``fields``, ``index`` may be a list of one index (or ``None``)
+        per field. A query word only narrows down the items if every
+        field has an index that can be used for it.
+
+        .. _filter-deadline:
+
+        **Time budget**
+
+        .. versionadded:: 1.38
+
+        If ``deadline_ms`` is set and scoring takes longer, scoring stops
+        and the best results found so far are returned. The budget starts
+        after the keys have been read and folded, as every rerun has to
+        do that again. If that setup alone takes longer than
+        ``deadline_ms``, or finishing would take less time than the setup,
+        all items are scored at once, as reruns would only make
+        filtering slower. The position
+        reached and the results are saved to the cache, and (with
+        :class:`~workflow.Workflow3`) :attr:`~workflow.Workflow3.rerun`
+        is set, so Alfred runs the Script Filter again and scoring resumes
+        where it stopped. The saved position is used if ``query`` and the
+        search keys, options (``key``, ``fields``, ``match_on``,
+        ``min_score``, ``weight`` etc.), number of items and matches
+        are the same, and it is less than :const:`DEADLINE_CURSOR_MAX_AGE`
+        seconds old. With a ``weight``, items are weighed as they're
+        scored, so only the best ``max_results`` are saved.
+
+        The deadline is checked every :const:`DEADLINE_CHUNK_SIZE` items,
+        so it may be overshot slightly.
+
+        **Parallel filtering**
+
+        .. versionadded:: 1.38
+
+        Very long lists are scored in a :class:`multiprocessing.Pool`
+        if that's faster than scoring them in the current process. See
+        :attr:`parallel_filter_threshold`. Not when ``stats`` is
+        ``True``, however, as the pool only returns each chunk's top
+        results, so not every item would be counted. With
+        a ``deadline_ms``, the items left when the deadline is reached
+        are scored in a pool instead of in a rerun if that's faster.
+
         """
-        if not query:
-            return items
+        started = time.time()
+        stats = FilterStats() if stats else None
 
         # Remove preceding/trailing spaces
-        query = query.strip()
+        query = (query or '').strip()
 
         if not query:
+            if stats is not None:
+                if not isinstance(items, Sequence):
+                    items = list(items)
+                stats.items = stats.results = len(items)
+                return items, stats
             return items
 
         # Use user override if there is one
         fold_diacritics = self.settings.get('__workflow_diacritic_folding',
                                             fold_diacritics)
 
-        results = []
+        if fields:
+            items, candidates, matches, args = self._prepare_fields(
+                query, items, fields, fold_diacritics, index, stats)
+            match_on = reduce(lambda a, b: a | b, [f[2] for f in fields])
+            scorer = self._score_fields
+        else:
+            items, candidates, matches, args = self._prepare_filter(
+                query, items, key, fold_diacritics, match_on, index, stats)
+            args += (match_on,)
+            scorer = self._score_matches
+
+        if deadline_ms:
+            fingerprint = self._deadline_fingerprint(
+                query, items, matches, args, fields, match_on,
+                fold_diacritics, min_score, max_results, ascending, weight)
+
+            # Weigh each chunk as it's scored, so the results saved
+            # to resume from can be pruned
+            score_chunk = scorer
+            if weight is not None:
+                def score_chunk(matches, *args):
+                    return self._weigh(scorer(matches, *args), items,
+                                       candidates, weight)
+
+            start = time.time()
+            scored = self._score_deadline(
+                matches, score_chunk, args, started, deadline_ms / 1000.0,
+                fingerprint, ascending, min_score, max_results)
+            if stats is not None:
+                stats.add('score', elapsed=time.time() - start)
+                stats.add_rules(match_on, len(matches),
+                                Counter([t[3] for t in scored]))
+                start = time.time()
+
+        elif stats is None:
+            # Weights change the scores, so chunks can't be pruned
+            # before they are applied
+            if weight is None:
+                scored = self._score_parallel(matches, scorer, args,
+                                              ascending, min_score,
+                                              max_results)
+            else:
+                scored = self._score_parallel(matches, scorer, args,
+                                              ascending, 0, 0)
+        else:
+            start = time.time()
+            scored = scorer(matches, *args)
+            if stats is not None:
+                stats.add('score', elapsed=time.time() - start)
+                stats.add_rules(match_on, len(matches),
+                                Counter([t[3] for t in scored]))
+                start = time.time()
+
+        if weight is not None and not deadline_ms:
+            scored = self._weigh(scored, items, candidates, weight)
+            if stats is not None:
+                stats.add('weight', elapsed=time.time() - start)
+                start = time.time()
+
+        results = [(sortkey, (items[candidates[j]], score, rule))
+                   for sortkey, j, score, rule in scored]
 
-        for item in items:
-            skip = False
-            score = 0
-            words = [s.strip() for s in query.split(' ')]
-            value = key(item).strip()
+        # sort on keys, then discard the keys
+        results.sort(reverse=ascending)
+        results = [t[1] for t in results]
+
+        if stats is not None:
+            stats.add('sort', elapsed=time.time() - start)
+            start = time.time()
+
+        if min_score:
+            n = len(results)
+            results = [r for r in results if r[1] > min_score]
+            if stats is not None:
+                stats.add('min_score', n - len(results),
+                          time.time() - start)
+
+        if max_results and len(results) > max_results:
+            if stats is not None:
+                stats.add('max_results', len(results) - max_results)
+            results = results[:max_results]
+
+        if stats is not None:
+            stats.results = len(results)
+            self.logger.debug('filter %r: %s', query, stats)
+
+        # return list of ``(item, score, rule)``
+        if not include_score:
+            # just return list of items
+            results = [t[0] for t in results]
+
+        if stats is not None:
+            return results, stats
+        return results
+
+    def ifilter(self, query, items, key=lambda x: x, include_score=False,
+                min_score=0, match_on=MATCH_ALL, fold_diacritics=True,
+                index=None, weight=None, fields=None):
+        """Generate ``items`` that match ``query``, best rules first.
+
+        .. versionadded:: 1.38
+
+        Like :meth:`filter`, but matching items are generated one rule
+        at a time in the order given in :meth:`filter`'s documentation.
+        That is, all items that match :const:`MATCH_STARTSWITH` are
+        generated (sorted by score) before any that match
+        :const:`MATCH_CAPITALS`, and so on.
+
+        Every item is scored once (in a process pool if that's faster,
+        see :attr:`parallel_filter_threshold`) and put in the bucket of
+        the rule it matched, so ``ifilter`` costs the same as
+        :meth:`filter`, whichever rules the query matches. Only the
+        buckets are sorted lazily, so stop iterating when you have
+        enough results.
+
+        For multi-word queries, an item is generated with the least
+        specific rule any of its words needed. A ``weight`` only changes
+        the order of items matched by the same rule. With multiple
+        ``fields``, each word's rule is that of the best-scoring field.
+
+        Arguments are the same as for :meth:`filter`. There is no
+        ``ascending`` or ``max_results``: stop iterating instead.
+
+        :returns: generator of ``items`` or of ``(item, score, rule)``
+            tuples if ``include_score`` is ``True``.
+
+        """
+        query = (query or '').strip()
+        if not query:
+            for item in items:
+                yield (item, 0, None) if include_score else item
+            return
+
+        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
+                                            fold_diacritics)
+
+        # Scorers return the least specific rule of the words
+        if fields:
+            items, candidates, matches, args = self._prepare_fields(
+                query, items, fields, fold_diacritics, index)
+            args += (True,)
+            scorer = self._score_fields
+        else:
+            items, candidates, matches, args = self._prepare_filter(
+                query, items, key, fold_diacritics, match_on, index)
+            args += (match_on, True)
+            scorer = self._score_matches
+
+        scored = self._score_parallel(matches, scorer, args, False, 0, 0)
+        if weight is not None:
+            scored = self._weigh(scored, items, candidates, weight)
+
+        buckets = {}
+        for t in scored:
+            if min_score and t[2] <= min_score:
+                continue
+            buckets.setdefault(t[3], []).append(t)
+
+        for rule in (MATCH_STARTSWITH, MATCH_CAPITALS, MATCH_ATOM,
+                     MATCH_INITIALS_STARTSWITH, MATCH_INITIALS_CONTAIN,
+                     MATCH_SUBSTRING, MATCH_ALLCHARS):
+            bucket = buckets.get(rule)
+            if not bucket:
+                continue
+
+            bucket.sort()
+            for _, j, score, r in bucket:
+                item = items[candidates[j]]
+                yield (item, score, r) if include_score else item
+
+    def _prepare_filter(self, query, items, key, fold_diacritics, match_on,
+                        index, stats=None):
+        """Find items that contain all characters of ``query``.
+
+        Shared by :meth:`filter` and :meth:`ifilter`. Rejections and
+        timings are added to ``stats`` if it's a :class:`FilterStats`.
+
+        :returns: ``(items, candidates, matches, args)`` tuple. ``items``
+            is ``items`` as a sequence, ``candidates`` the indices of items
+            that may match ``query``, ``matches`` the positions in
+            ``candidates`` that contain all characters of ``query``, and
+            ``args`` the arguments (other than ``match_on``) for
+            :meth:`_score_matches`.
+
+        """
+        words = [s.strip() for s in query.split(' ')]
+        words = [s for s in words if s]
+
+        if not isinstance(items, Sequence):
+            items = list(items)
+
+        # ASCII words are matched against folded values (if folding is
+        # on), other words against the originals
+        folded_words = [w for w in words if fold_diacritics and isascii(w)]
+        other_words = [w for w in words if w not in folded_words]
+
+        # Indices of items that might match `query`
+        start = time.time()
+        keys = candidates = None
+        if index is not None:
+            valid, keys = self._index_valid(index, items, key)
+            if not valid:
+                index = None
+        if index is not None:
+            candidates = self._index_candidates(index, folded_words, match_on)
+        if candidates is None:
+            candidates = range(len(items))
+
+        if stats is not None:
+            stats.items = len(items)
+            if index is not None:
+                stats.add('index', len(items) - len(candidates),
+                          time.time() - start)
+            start = time.time()
+
+        # Fold each value once. `matches` are the positions in
+        # `candidates` of items that contain all characters of `query`.
+        if keys is None:
+            values = [key(items[i]).strip() for i in candidates]
+        else:
+            values = [keys[i].strip() for i in candidates]
+        folded = values
+
+        if stats is not None:
+            stats.add('keys', elapsed=time.time() - start)
+            empty = values.count('')
+            start = time.time()
+
+        if folded_words:
+            folded = [self.fold_to_ascii(v) for v in values]
+
+        if stats is not None:
+            stats.add('fold', elapsed=time.time() - start)
+            start = time.time()
+
+        # The index's charset masks are of the folded keys
+        masks = None
+        if index is not None:
+            masks = [index.charset_masks[i] for i in candidates]
+
+        matches = None
+        if folded_words:
+            matches = self._charset_filter(folded, folded_words, masks=masks)
+        if other_words:
+            matches = self._charset_filter(values, other_words, matches)
+
+        # Empty keys never contain the query's characters, so the
+        # charset filter has rejected them, too
+        if stats is not None:
+            stats.add('empty', empty)
+            stats.add('charset', len(candidates) - len(matches) - empty,
+                      time.time() - start)
+
+        return items, candidates, matches, (values, folded, words,
+                                            folded_words)
+
+    def _score_matches(self, matches, values, folded, words, folded_words,
+                       match_on, least_specific=False):
+        """Score ``values`` at positions ``matches`` against ``words``.
+
+        :param least_specific: return the least specific rule any word
+            needed (for :meth:`ifilter`) instead of the last word's
+        :type least_specific: ``Boolean``
+        :returns: list of ``(sortkey, position, score, rule)`` tuples
+            for values that match all ``words``.
+
+        """
+        scored = []
+
+        for j in matches:
+            value = values[j]
             if value == '':
                 continue
+
+            skip = False
+            score = worst = 0
             for word in words:
-                if word == '':
-                    continue
-                s, rule = self._filter_item(value, word, match_on,
-                                            fold_diacritics)
+                # Values are already folded, so don't fold them again
+                v = folded[j] if word in folded_words else value
+                s, rule = self._filter_item(v, word, match_on, False)
 
                 if not s:  # Skip items that don't match part of the query
                     skip = True
+                    break
                 score += s
+                # Rules are ordered from most to least specific
+                worst = max(worst, rule)
+
+            if least_specific:
+                rule = worst
 
             if skip:
                 continue
@@ -1902,24 +3291,480 @@ class Workflow(object):
                 # use "reversed" `score` (i.e. highest becomes lowest) and
                 # `value` as sort key. This means items with the same score
                 # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), score),
-                                (item, score, rule)))
+                scored.append(((100.0 / score, value.lower(), score),
+                               j, score, rule))
 
-        # sort on keys, then discard the keys
-        results.sort(reverse=ascending)
-        results = [t[1] for t in results]
+        return scored
+
+    def _prepare_fields(self, query, items, fields, fold_diacritics, index,
+                        stats=None):
+        """Like :meth:`_prepare_filter`, but for multiple ``fields``.
+
+        Items must contain all characters of ``query`` in any of
+        their fields.
+
+        :returns: ``(items, candidates, matches, args)`` tuple. ``args``
+            are the arguments for :meth:`_score_fields`.
+
+        """
+        words = [s.strip() for s in query.split(' ')]
+        words = [s for s in words if s]
+
+        if not isinstance(items, Sequence):
+            items = list(items)
+
+        folded_words = [w for w in words if fold_diacritics and isascii(w)]
+        other_words = [w for w in words if w not in folded_words]
+
+        start = time.time()
+        keys = candidates = None
+        if index is not None and len(index) != len(fields):
+            self.logger.warning('ignored search index: %d indices for %d '
+                                'fields', len(index), len(fields))
+            index = None
+        if index is not None:
+            # Check each index once, not once per word
+            checked, keys = [], []
+            for idx, (key, _, _) in zip(index, fields):
+                valid, k = False, None
+                if idx is not None:
+                    valid, k = self._index_valid(idx, items, key)
+                checked.append(idx if valid else None)
+                keys.append(k)
+
+            index = checked
+            candidates = self._index_fields(index, fields, folded_words)
+        if candidates is None:
+            candidates = range(len(items))
+
+        if stats is not None:
+            stats.items = len(items)
+            if index is not None:
+                stats.add('index', len(items) - len(candidates),
+                          time.time() - start)
+            start = time.time()
+
+        # ``(values, folded, weight, match_on)`` for each field
+        columns = []
+        for n, (key, weight, match_on) in enumerate(fields):
+            if keys is None or keys[n] is None:
+                values = [key(items[i]).strip() for i in candidates]
+            else:
+                values = [keys[n][i].strip() for i in candidates]
+            folded = values
+            if folded_words:
+                folded = [self.fold_to_ascii(v) for v in values]
+            columns.append((values, folded, weight, match_on))
+
+        if stats is not None:
+            stats.add('keys', elapsed=time.time() - start)
+            empty = len([t for t in zip(*[c[0] for c in columns])
+                         if not any(t)])
+            start = time.time()
+
+        # Run the charset filter on all fields at once. The mask of
+        # the joined fields is the union of the fields' masks.
+        masks = None
+        if index is not None and None not in index:
+            masks = [reduce(lambda a, b: a | b,
+                            [idx.charset_masks[i] for idx in index])
+                     for i in candidates]
+
+        matches = None
+        if folded_words:
+            joined = [' '.join(t) for t in zip(*[c[1] for c in columns])]
+            matches = self._charset_filter(joined, folded_words, masks=masks)
+        if other_words:
+            joined = [' '.join(t) for t in zip(*[c[0] for c in columns])]
+            matches = self._charset_filter(joined, other_words, matches)
+
+        if stats is not None:
+            stats.add('empty', empty)
+            stats.add('charset', len(candidates) - len(matches) - empty,
+                      time.time() - start)
+
+        return items, candidates, matches, (columns, words, folded_words)
+
+    def _index_fields(self, index, fields, words):
+        """Return indices of items that may match ``words`` in any field.
+
+        :param index: one index (or ``None``) per field
+        :type index: ``list``
+        :returns: sorted indices or ``None`` if the indices can't be used
+        :rtype: ``list`` or ``None``
+
+        """
+        candidates = None
+        for word in words:
+            # Union of the fields' candidates
+            hits = set()
+            for idx, (_, _, match_on) in zip(index, fields):
+                h = None
+                if idx is not None:
+                    h = self._index_candidates(idx, [word], match_on)
+                if h is None:  # field can't be narrowed down
+                    hits = None
+                    break
+                hits.update(h)
+
+            if hits is None:
+                continue
+
+            if candidates is None:
+                candidates = hits
+            else:
+                candidates &= hits
+
+        if candidates is None:
+            return None
+
+        return sorted(candidates)
+
+    def _score_fields(self, matches, columns, words, folded_words,
+                      least_specific=False):
+        """Score multiple fields at positions ``matches`` against ``words``.
+
+        Each word is scored against every field, and the best weighted
+        score counts. As with :meth:`_score_matches`, a match can have
+        a negative score (e.g. a short query in a very long value).
+
+        :param least_specific: see :meth:`_score_matches`
+        :type least_specific: ``Boolean``
+        :returns: same as :meth:`_score_matches`
+
+        """
+        scored = []
+
+        for j in matches:
+            score = worst = 0
+            for word in words:
+                best = None
+                for values, folded, weight, match_on in columns:
+                    # Values are already folded, so don't fold them again
+                    v = folded[j] if word in folded_words else values[j]
+                    if v == '':
+                        continue
+
+                    s, r = self._filter_item(v, word, match_on, False)
+                    if not s:  # no match
+                        continue
+                    s *= weight
+                    if best is None or s > best:
+                        best, rule = s, r
+
+                # Skip items that don't match part of the query
+                if best is None:
+                    score = 0
+                    break
+                score += best
+                worst = max(worst, rule)
+
+            if least_specific:
+                rule = worst
+
+            if score:
+                value = columns[0][0][j]
+                scored.append(((100.0 / score, value.lower(), score),
+                               j, score, rule))
+
+        return scored
+
+    def _weigh(self, scored, items, candidates, weight):
+        """Multiply scores by ``weight`` of their items.
+
+        :param scored: results of :meth:`_score_matches`
+        :type scored: ``list``
+        :returns: ``scored`` with new scores and sort keys
+        :rtype: ``list``
+
+        """
+        weighed = []
+        for (_, value, _), j, score, rule in scored:
+            score *= weight(items[candidates[j]])
+            if score:
+                weighed.append(((100.0 / score, value, score), j, score, rule))
+
+        return weighed
+
+    def _deadline_fingerprint(self, query, items, matches, args, fields,
+                              match_on, fold_diacritics, min_score,
+                              max_results, ascending, weight):
+        """Return fingerprint of a :meth:`filter` call with a deadline.
+
+        A saved cursor is only valid for the same query and options,
+        and the same search keys. The keys are hashed, as functions
+        such as ``key`` can't be compared between runs.
+
+        :returns: fingerprint for :meth:`_score_deadline`
+        :rtype: ``tuple``
+
+        """
+        digest = hashlib.sha1()
+        if fields:
+            columns = [c[0] for c in args[0]]
+            options = tuple([c[2:] for c in args[0]])
+        else:
+            columns = [args[0]]
+            options = match_on
+
+        for values in columns:
+            digest.update('\0'.join(values).encode('utf-8'))
+            digest.update(b'\1')
+
+        if weight is not None:
+            weight = getattr(weight, '__name__', type(weight).__name__)
+
+        return (query, len(items), len(matches), options, fold_diacritics,
+                min_score, max_results, ascending, weight,
+                digest.hexdigest())
+
+    def _score_deadline(self, matches, scorer, args, started, budget,
+                        fingerprint, ascending, min_score, max_results):
+        """Score ``matches`` for ``budget`` seconds, resuming from saved cursor.
+
+        The budget starts after the setup (everything since ``started``,
+        i.e. getting the keys, folding them, and loading the cursor),
+        because every rerun has to repeat the setup. For the same
+        reason, scoring only stops if finishing would take longer than
+        the setup, and never if the setup alone took longer than
+        ``budget``, as reruns would then cost more than they save.
+
+        :param scorer: :meth:`_score_matches` or :meth:`_score_fields`
+        :type scorer: ``callable``
+        :param args: remaining arguments to ``scorer``
+        :type args: ``tuple``
+        :param started: time :meth:`filter` was called
+        :type started: ``float``
+        :param budget: seconds to score for
+        :type budget: ``float``
+        :param fingerprint: identifies the query the cursor belongs to
+        :type fingerprint: ``tuple``
+        :returns: same as :meth:`_score_matches`
+
+        """
+        cursor, scored = 0, []
+        state = self.cached_data('__workflow_filter_cursor',
+                                 max_age=DEADLINE_CURSOR_MAX_AGE)
+        if state and state[0] == fingerprint:
+            _, cursor, scored = state
+            self.logger.debug('resuming filter at %d/%d', cursor,
+                              len(matches))
+
+        start = time.time()
+        setup = start - started
+        deadline = None
+        if setup < budget:
+            deadline = start + budget
+        else:
+            self.logger.debug('filter setup took longer than deadline '
+                              '(%0.3fs), scoring all items', setup)
+            scored.extend(self._score_parallel(matches[cursor:], scorer, args,
+                                               ascending, min_score,
+                                               max_results))
+            cursor = len(matches)
+
+        # Always score at least one chunk, so each run makes progress
+        first = cursor
+        while cursor < len(matches):
+            chunk = matches[cursor:cursor + DEADLINE_CHUNK_SIZE]
+            results = scorer(chunk, *args)
+            scored.extend(results)
+            cursor += len(chunk)
+
+            now = time.time()
+            if deadline is None or now < deadline:
+                continue
+
+            # Finish if that's quicker than a rerun's setup
+            per_item = (now - start) / (cursor - first)
+            rest = matches[cursor:]
+            if per_item * len(rest) <= setup:
+                continue
 
+            # Or in a process pool if that's quicker than scoring here
+            processes = self._pool_processes(chunk, results, per_item,
+                                             len(rest), max_results)
+            if processes:
+                scored.extend(self._score_pool(rest, processes, scorer,
+                                               args, ascending, min_score,
+                                               max_results))
+                cursor = len(matches)
+
+            break
+
+        if cursor == len(matches):
+            if state:
+                self.cache_data('__workflow_filter_cursor', None)
+            return scored
+
+        # Out of time. Save results to resume from, discarding any
+        # that can't make the final cut.
         if min_score:
-            results = [r for r in results if r[1] > min_score]
+            scored = [t for t in scored if t[2] > min_score]
+        if max_results and len(scored) > max_results:
+            scored.sort(reverse=ascending)
+            scored = scored[:max_results]
+
+        self.cache_data('__workflow_filter_cursor',
+                        (fingerprint, cursor, scored))
+        self.logger.debug('filter deadline reached at %d/%d', cursor,
+                          len(matches))
+
+        # Only Workflow3 can ask Alfred to run the Script Filter again
+        if hasattr(self, 'rerun'):
+            self.rerun = DEADLINE_RERUN
+
+        return scored
+
+    def _score_parallel(self, matches, scorer, args, ascending, min_score,
+                        max_results):
+        """Score ``matches`` in a process pool if it's worth it.
+
+        The first :data:`PARALLEL_SAMPLE_SIZE` values are scored in
+        this process to measure how long scoring takes (see
+        :meth:`_pool_processes`). If the pool is faster, the rest are
+        scored in a :class:`multiprocessing.Pool`.
+
+        :param matches: positions of values to score
+        :type matches: ``list``
+        :param scorer: :meth:`_score_matches` or :meth:`_score_fields`
+        :type scorer: ``callable``
+        :param args: remaining arguments to ``scorer``
+        :type args: ``tuple``
+        :returns: same as :meth:`_score_matches`. Each chunk only
+            returns its top ``max_results`` results.
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        """
+        if (self.parallel_filter_threshold == 0 or
+                len(matches) < PARALLEL_MIN_ITEMS):
+            return scorer(matches, *args)
 
-        # return list of ``(item, score, rule)``
-        if include_score:
-            return results
-        # just return list of items
-        return [t[0] for t in results]
+        sample = matches[:PARALLEL_SAMPLE_SIZE]
+        rest = matches[PARALLEL_SAMPLE_SIZE:]
+
+        start = time.time()
+        scored = scorer(sample, *args)
+        per_item = (time.time() - start) / len(sample)
+
+        processes = self._pool_processes(sample, scored, per_item,
+                                         len(rest), max_results)
+        if processes:
+            scored.extend(self._score_pool(rest, processes, scorer, args,
+                                           ascending, min_score,
+                                           max_results))
+        else:
+            scored.extend(scorer(rest, *args))
+
+        return scored
+
+    def _pool_processes(self, sample, scored, per_item, remaining,
+                        max_results):
+        """Number of processes to score ``remaining`` items with.
+
+        Works out the break-even point of serial and parallel scoring
+        (unless :attr:`parallel_filter_threshold` is set) from how long
+        scoring ``sample`` took and how long it takes to pickle it and
+        its results, which are sent between the processes.
+
+        :param sample: positions of values already scored
+        :type sample: ``list``
+        :param scored: results of scoring ``sample``
+        :type scored: ``list``
+        :param per_item: seconds it took to score each item of ``sample``
+        :type per_item: ``float``
+        :param remaining: number of items left to score
+        :type remaining: ``int``
+        :returns: number of processes, or ``0`` if the items should
+            be scored in the current process.
+        :rtype: ``int``
+
+        """
+        threshold = self.parallel_filter_threshold
+        if threshold == 0 or remaining < PARALLEL_MIN_ITEMS - len(sample):
+            return 0
+
+        import multiprocessing
+        processes = multiprocessing.cpu_count()
+        if processes < 2:
+            return 0
+
+        if threshold is None:
+            # Chunks are pickled to send them to the pool, and their
+            # results to send them back. Chunks return at most
+            # `max_results` results.
+            start = time.time()
+            cPickle.loads(cPickle.dumps(sample, cPickle.HIGHEST_PROTOCOL))
+            send = (time.time() - start) / len(sample)
+            start = time.time()
+            cPickle.loads(cPickle.dumps(scored, cPickle.HIGHEST_PROTOCOL))
+            receive = (time.time() - start) / max(len(scored), 1)
+
+            # Results per item
+            results = float(len(scored)) / len(sample)
+            if max_results:
+                results = min(results,
+                              float(max_results * processes * 4) / remaining)
+            ipc = send + receive * results
+
+            startup = self.cached_data('__workflow_pool_startup', max_age=0)
+            startup = startup or DEFAULT_POOL_STARTUP
+            # Time saved per item by scoring in parallel
+            saving = per_item * (processes - 1) / processes - ipc
+            threshold = startup / saving if saving > 0 else remaining + 1
+
+        if remaining < threshold:
+            return 0
+
+        return processes
+
+    def _score_pool(self, matches, processes, scorer, args, ascending,
+                    min_score, max_results):
+        """Score ``matches`` in a :class:`multiprocessing.Pool`.
+
+        :param matches: positions of values to score
+        :type matches: ``list``
+        :param processes: number of worker processes
+        :type processes: ``int``
+        :returns: same as :meth:`_score_matches`. Each chunk only
+            returns its top ``max_results`` results.
+
+        """
+        global _filter_state
+        import multiprocessing
+
+        size = len(matches) // (processes * 4) + 1
+        chunks = [matches[i:i + size] for i in range(0, len(matches), size)]
+
+        self.logger.debug('scoring %d items in %d processes ...',
+                          len(matches), processes)
+
+        # Chunks are scored by `_filter_chunk`, which gets the data
+        # from forked copies of `_filter_state`
+        _filter_state = (scorer, args, ascending, min_score, max_results)
+
+        start = time.time()
+        pool = multiprocessing.Pool(processes)
+        try:
+            started = time.time()
+            results = pool.map(_filter_chunk, chunks)
+            finished = time.time()
+        finally:
+            pool.terminate()
+            _filter_state = None
+
+        # Pool overhead is everything but the actual work. Update the
+        # stored value gradually to smooth out outliers.
+        overhead = (started - start) + (time.time() - finished)
+        previous = self.cached_data('__workflow_pool_startup', max_age=0)
+        if previous:
+            overhead = (previous + overhead) / 2.0
+        self.cache_data('__workflow_pool_startup', overhead)
+
+        scored = []
+        for r in results:
+            scored.extend(r)
+
+        return scored
 
     def _filter_item(self, value, query, match_on, fold_diacritics):
         """Filter ``value`` against ``query`` using rules ``match_on``.
@@ -1935,11 +3780,8 @@ class Workflow(object):
         if fold_diacritics:
             value = self.fold_to_ascii(value)
 
-        # pre-filter any items that do not contain all characters
-        # of ``query`` to save on running several more expensive tests
-        if not set(query) <= set(value.lower()):
-
-            return (0, None)
+        # Items that don't contain all the characters of `query` have
+        # already been rejected by `_charset_filter()`
 
         # item starts with query
         if match_on & MATCH_STARTSWITH and value.lower().startswith(query):
@@ -2013,6 +3855,110 @@ class Workflow(object):
         # Nothing matched
         return (0, None)
 
+    def _index_valid(self, index, items, key):
+        """Check whether ``index`` was built from ``items``.
+
+        If ``items`` has a ``digest`` (e.g. a
+        :class:`~workflow.records.RecordTable`) that matches the index's,
+        the index is trusted. Otherwise, the fingerprint of the items'
+        keys is compared, which means calling ``key`` on every item.
+
+        :param index: index of the items' search keys
+        :type index: :class:`~workflow.index.TrigramIndex`
+        :param items: items being filtered
+        :type items: ``list``
+        :param key: function that returns the search key of an item
+        :type key: ``callable``
+        :returns: ``(valid, keys)`` tuple. ``keys`` are the keys of all
+            items if they were needed for the check, else ``None``.
+        :rtype: ``tuple``
+
+        """
+        digest = getattr(items, 'digest', None)
+        if digest is not None and digest == index.digest:
+            return True, None
+
+        keys = [key(item) for item in items]
+        if index.built_from(keys):
+            return True, keys
+
+        self.logger.warning('ignored search index: not built from '
+                            'these %d items', len(keys))
+        return False, keys
+
+    def _index_candidates(self, index, words, match_on):
+        """Return indices of items that ``index`` says may match ``words``.
+
+        ``index`` must already have been checked with :meth:`_index_valid`.
+
+        :param index: index of the items' search keys
+        :type index: :class:`~workflow.index.TrigramIndex`
+        :param words: folded query words
+        :type words: ``list``
+        :param match_on: ``MATCH_*`` rules in use
+        :type match_on: ``int``
+        :returns: sorted indices or ``None`` if ``index`` can't be used
+        :rtype: ``list`` or ``None``
+
+        """
+        if match_on & MATCH_ALLCHARS:
+            return None
+
+        candidates = None
+        for word in words:
+            hits = index.candidates(word.lower())
+            if hits is None:  # word too short
+                continue
+
+            if candidates is None:
+                candidates = hits
+            else:
+                candidates = sorted(set(candidates).intersection(hits))
+
+        return candidates
+
+    def _charset_filter(self, values, words, candidates=None, masks=None):
+        """Return indices of ``values`` that contain all characters of ``words``.
+
+        This is the cheapest test, so it's run on all items before the
+        more expensive ``MATCH_*`` rules. If ``masks`` are given, the
+        bitmasks of the characters of the values are compared to a mask
+        of all the query's characters with a bitwise AND. Building the
+        masks costs more than the test saves, so without precomputed
+        masks, each value's set of characters is compared instead.
+
+        :param values: search keys of the items
+        :type values: ``list``
+        :param words: words of the query
+        :type words: ``list``
+        :param candidates: only test the values at these indices
+        :type candidates: ``list``
+        :param masks: precomputed masks of ``values``, e.g. from
+            :attr:`TrigramIndex.charset_masks
+            <workflow.index.TrigramIndex.charset_masks>`
+        :type masks: ``list``
+        :returns: sorted indices of matching values
+        :rtype: ``list``
+
+        """
+        if candidates is None:
+            candidates = range(len(values))
+
+        chars = set(''.join(words).lower())
+        if masks is None:
+            return [i for i in candidates if chars <= set(values[i].lower())]
+
+        qmask = _charset_mask(chars)
+        masks = array(_CHARSET_TYPECODE, [masks[i] for i in candidates])
+        hits = _charset_matches(masks, qmask)
+
+        # Characters without their own bit need the exact test
+        if qmask & _CHARSET_OTHER:
+            hits = [j for j in hits
+                    if chars <= set(values[candidates[j]].lower())]
+
+        return [candidates[j] for j in hits]
+
     def _search_for_query(self, query):
         if query in self._search_pattern_cache:
             return self._search_pattern_cache[query]
@@ -2049,6 +3995,10 @@ class Workflow(object):
 
         """
         start = time.time()
+        # Write changes to settings once, at the end
+        self._running = True
+        if self._settings is not None:
+            self._settings.write_behind = True
 
         # Write to debugger to ensure "real" output starts on a new line
         print('.', file=sys.stderr)
@@ -2062,6 +4012,17 @@ class Workflow(object):
             else:
                 self.logger.debug('---------- %s ----------', self.name)
 
+            # Started by `refresh_cache()` to renew a cache
+            refresh = os.getenv('_WF_CACHE_REFRESH')
+            if refresh:
+                self._refresh_cached(refresh.decode('utf-8'))
+                return 0
+
+            # Started by `warm_caches()`
+            if os.getenv('_WF_CACHE_WARM'):
+                self.cache_warmer(self)
+                return 0
+
             # Run update check if configured for self-updates.
             # This call has to go in the `run` try-except block, as it will
             # initialise `self.settings`, which will raise an exception
@@ -2072,10 +4033,22 @@ class Workflow(object):
             # Run workflow's entry function/method
             func(self)
 
+            # Before `set_last_version()` changes `first_run`
+            if self.cache_warmer and self._cache_warm_needed():
+                self.warm_caches()
+
             # Set last version run to current version after a successful
             # run
             self.set_last_version()
 
+            if self.cache_max_bytes:
+                self.check_cache_size()
+
+            if self.cache_namespace:
+                self.check_cache_namespace()
+
+            self._flush_settings()
+
         except Exception as err:
             self.logger.exception(err)
             if self.help_url:
@@ -2099,11 +4072,25 @@ class Workflow(object):
             return 1
 
         finally:
+            # Save changes made before an error or `sys.exit()`
+            for func in (self._flush_settings, self.save_cache_stats):
+                try:
+                    func()
+                except Exception as err:
+                    self.logger.exception(err)
+
             self.logger.debug('---------- finished in %0.3fs ----------',
                               time.time() - start)
 
         return 0
 
+    def _flush_settings(self):
+        """Turn off :attr:`Settings.write_behind` and save changes."""
+        self._running = False
+        if self._settings is not None:
+            self._settings.write_behind = False
+            self._settings.flush()
+
     # Alfred feedback methods ------------------------------------------
 
     def add_item(self, title, subtitle='', modifier_subtitles=None, arg=None,
@@ -2596,6 +4583,47 @@ class Workflow(object):
         self.magic_arguments['magic'] = list_magic
         self.magic_arguments['version'] = show_version
 
+        # Cache statistics
+        def show_cache_stats():
+            """Display hit rate etc. of each cache key in Alfred."""
+            stats = self.cache_stats()
+            if not stats:
+                return 'No cache statistics recorded'
+
+            def total(d):
+                return d['hit'] + d['stale'] + d['wait'] + d['miss']
+
+            isatty = sys.stdout.isatty()
+            for name in sorted(stats, key=lambda n: -total(stats[n])):
+                d = stats[name]
+                served = d['hit'] + d['stale']
+                # Hit rate of lookups that found fresh data or regenerated
+                # them. Stale and waited-for data are counted separately.
+                subtitle = '{0} lookups, '.format(total(d))
+                if d['hit'] + d['miss']:
+                    subtitle += '{0:.0%} hits, '.format(
+                        float(d['hit']) / (d['hit'] + d['miss']))
+                subtitle += '{0} stale, {1} waited, {2} misses'.format(
+                    d['stale'], d['wait'], d['miss'])
+                if d['miss']:
+                    subtitle += ', {0:.0f} ms to regenerate'.format(
+                        d['regenerate'] / d['miss'] * 1000)
+                if served:
+                    subtitle += ', avg. age {0:.0f} s'.format(
+                        d['age'] / served)
+
+                self.logger.debug('%s: %s', name, subtitle)
+                if not isatty:
+                    self.add_item(name, subtitle, icon=ICON_INFO)
+
+            if not isatty:
+                self.send_feedback()
+
+            # Don't run the workflow with the magic argument as query
+            sys.exit(0)
+
+        self.magic_arguments['cachestats'] = show_cache_stats
+
     def clear_cache(self, filter_func=lambda f: True):
         """Delete all files in workflow's :attr:`cachedir`.
 
@@ -2606,8 +4634,137 @@ class Workflow(object):
             By default, *all* files will be deleted.
         :type filter_func: ``callable``
         """
+        # Keys stored by the backend. Filenames are "<name>.<serializer>".
+        self.cache_backend.clear(filter_func)
+        # Don't delete files the backend has open, e.g. the SQLite
+        # database. It reopens them when next used.
+        self.cache_backend.close()
         self._delete_directory_contents(self.cachedir, filter_func)
 
+    def check_cache_size(self, force=False):
+        """Shrink the cache in the background if it's time to check its size.
+
+        .. versionadded:: 1.38
+
+        Called by :meth:`run` after your workflow has run if
+        :attr:`cache_max_bytes` is set. The size is checked at most once
+        an hour unless ``force`` is ``True``, and :meth:`evict_cache` is
+        run in a background process, so a large cache doesn't slow down
+        your workflow.
+
+        :param force: Check size even if it was checked recently
+        :type force: ``Boolean``
+
+        """
+        key = '__workflow_cache_evict'
+        if not force and self.cached_data_fresh(key, CACHE_EVICT_INTERVAL):
+            self.logger.debug('cache size check not due')
+            return
+
+        from background import run_in_background
+
+        # cache.py is adjacent to this file
+        cache_script = os.path.join(os.path.dirname(__file__), b'cache.py')
+
+        cmd = ['/usr/bin/python', cache_script, 'evict',
+               str(self.cache_max_bytes)]
+
+        self.logger.info('checking cache size ...')
+
+        run_in_background('__workflow_cache_evict', cmd)
+
+    def evict_cache(self, max_bytes=None):
+        """Delete least recently used cached data to shrink cache.
+
+        .. versionadded:: 1.38
+
+        Data in :attr:`cachedir` are deleted, least recently used first,
+        until the directory is no larger than ``max_bytes``. Files that
+        weren't written with :meth:`cache_data`, like session caches and
+        the arguments of background jobs, are also deleted. See
+        :func:`workflow.cache.evict` for details.
+
+        This can take a while with a large cache, so you probably want
+        to call :meth:`check_cache_size` instead.
+
+        :param max_bytes: Size to shrink cache to. Default is
+            :attr:`cache_max_bytes`.
+        :type max_bytes: ``int``
+        :returns: keys/filenames of deleted data
+        :rtype: ``list``
+
+        """
+        max_bytes = max_bytes or self.cache_max_bytes
+        if not max_bytes:
+            raise ValueError('No maximum cache size set')
+
+        size, evicted = evict_cache_entries(self.cache_backend, max_bytes)
+        self.logger.debug('cache size: %d bytes, max: %d bytes',
+                          size, max_bytes)
+        for key in evicted:
+            self.logger.debug('evicted from cache: %s', key)
+
+        self.cache_data('__workflow_cache_evict', time.time())
+
+        return evicted
+
+    def check_cache_namespace(self):
+        """Delete other namespaces' data in the background if necessary.
+
+        .. versionadded:: 1.38
+
+        Called by :meth:`run` after your workflow has run if
+        :attr:`cache_namespace` is set. When the namespace has changed
+        (e.g. the workflow was updated), :meth:`collect_cache_garbage`
+        is run in a background process, so old data are deleted
+        without slowing down your workflow. New data are cached on
+        demand as usual.
+
+        """
+        key = '__workflow_cache_namespace'
+        if self.cached_data(key, max_age=0) == self.cache_namespace:
+            return
+
+        from background import run_in_background
+
+        # cache.py is adjacent to this file
+        cache_script = os.path.join(os.path.dirname(__file__), b'cache.py')
+
+        cmd = ['/usr/bin/python', cache_script, 'gc', self.cache_namespace]
+
+        self.logger.info('deleting data of old cache namespaces ...')
+
+        run_in_background('__workflow_cache_gc', cmd)
+
+    def collect_cache_garbage(self, namespace=None):
+        """Delete data cached in namespaces other than ``namespace``.
+
+        .. versionadded:: 1.38
+
+        Data cached without a namespace are left alone. See
+        :func:`workflow.cache.collect` for details.
+
+        You probably want to call :meth:`check_cache_namespace` instead.
+
+        :param namespace: namespace to keep. Default is
+            :attr:`cache_namespace`.
+        :type namespace: ``unicode``
+        :returns: keys/filenames of deleted data
+        :rtype: ``list``
+
+        """
+        namespace = namespace or self.cache_namespace
+        if not namespace:
+            raise ValueError('No cache namespace set')
+
+        deleted = collect_cache_garbage(self.cache_backend, namespace)
+        for key in deleted:
+            self.logger.debug('deleted from old cache namespace: %s', key)
+
+        self.cache_data('__workflow_cache_namespace', namespace)
+
+        return deleted
+
     def clear_data(self, filter_func=lambda f: True):
         """Delete all files in workflow's :attr:`datadir`.
 
@@ -2715,11 +4872,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
-        return unicode(unicodedata.normalize('NFKD',
-                       text).encode('ascii', 'ignore'))
+        return fold_to_ascii(text)
 
     def dumbify_punctuation(self, text):
         """Convert non-ASCII punctuation to closest ASCII equivalent.
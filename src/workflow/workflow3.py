@@ -598,7 +598,7 @@ class Workflow3(Workflow):
         """New cache name/key based on session ID."""
         return self._session_prefix + name
 
-    def cache_data(self, name, data, session=False):
+    def cache_data(self, name, data, session=False, compression=0):
         """Cache API with session-scoped expiry.
 
         .. versionadded:: 1.25
@@ -608,8 +608,9 @@ class Workflow3(Workflow):
             data (object): Data to cache
             session (bool, optional): Whether to scope the cache
                 to the current session.
+            compression (int, optional): zlib compression level.
 
-        ``name`` and ``data`` are the same as for the
+        ``name``, ``data`` and ``compression`` are the same as for the
         :meth:`~workflow.Workflow.cache_data` method on
         :class:`~workflow.Workflow`.
 
@@ -620,9 +621,10 @@ class Workflow3(Workflow):
         if session:
             name = self._mk_session_name(name)
 
-        return super(Workflow3, self).cache_data(name, data)
+        return super(Workflow3, self).cache_data(name, data, compression)
 
-    def cached_data(self, name, data_func=None, max_age=60, session=False):
+    def cached_data(self, name, data_func=None, max_age=60, session=False,
+                    compression=0):
         """Cache API with session-scoped expiry.
 
         .. versionadded:: 1.25
@@ -634,9 +636,39 @@ class Workflow3(Workflow):
             max_age (int): Maximum allowable age of cache in seconds.
             session (bool, optional): Whether to scope the cache
                 to the current session.
+            compression (int, optional): zlib compression level.
+
+        ``name``, ``data_func``, ``max_age`` and ``compression`` are the
+        same as for the :meth:`~workflow.Workflow.cached_data` method on
+        :class:`~workflow.Workflow`.
+
+        If ``session`` is ``True``, then ``name`` is prefixed
+        with :attr:`session_id`.
+
+        """
+        if session:
+            name = self._mk_session_name(name)
+
+        return super(Workflow3, self).cached_data(name, data_func, max_age,
+                                                  compression)
+
+    def cached_records(self, name, data_func=None, max_age=60,
+                       session=False):
+        """Cached list of records with session-scoped expiry.
+
+        .. versionadded:: 1.38
+
+        Args:
+            name (str): Cache key
+            data_func (callable): Callable that returns a list of
+                records. It is called if the cache has expired or
+                doesn't exist.
+            max_age (int): Maximum allowable age of cache in seconds.
+            session (bool, optional): Whether to scope the cache
+                to the current session.
 
         ``name``, ``data_func`` and ``max_age`` are the same as for the
-        :meth:`~workflow.Workflow.cached_data` method on
+        :meth:`~workflow.Workflow.cached_records` method on
         :class:`~workflow.Workflow`.
 
         If ``session`` is ``True``, then ``name`` is prefixed
@@ -646,7 +678,14 @@ class Workflow3(Workflow):
         if session:
             name = self._mk_session_name(name)
 
-        return super(Workflow3, self).cached_data(name, data_func, max_age)
+        return super(Workflow3, self).cached_records(name, data_func,
+                                                     max_age)
+
+    def _policy_key(self, name, policy):
+        """Return cache key for ``name``, prefixed if session-scoped."""
+        if policy.session:
+            return self._mk_session_name(name)
+        return name
 
     def clear_session_cache(self, current=False):
         """Remove session data from the cache.
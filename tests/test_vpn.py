@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright (c) 2019 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""Tests for vpn.py.
+
+Run from the repo root with ``python -m unittest discover -s tests``.
+"""
+
+from __future__ import print_function, absolute_import
+
+from contextlib import contextmanager
+from cStringIO import StringIO
+import multiprocessing
+import multiprocessing.pool
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import vpn  # noqa: E402
+from workflow import Workflow3  # noqa: E402
+
+
+CITIES = [u'Frankfurt', u'Zürich', u'New York']
+
+
+class Fake(vpn.VPNApp):
+    """VPN app with a configurable number of connections."""
+
+    #: Number of connections returned by `_fetch_connections`
+    count = 30
+
+    program = ['true']
+    download_url = 'https://example.com'
+    info = {'name': 'Fake'}
+
+    def _fetch_connections(self):
+        return [vpn.VPN(u'Server %d %s' % (i, CITIES[i % 3]), i == 1,
+                        u'host%d.example.com' % i, u'UDP')
+                for i in range(self.count)]
+
+
+@contextmanager
+def patched(obj, name, value):
+    """Temporarily replace attribute ``name`` of ``obj``."""
+    orig = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, orig)
+
+
+class VPNTestCase(unittest.TestCase):
+    """Run `do_list` in a new workflow in temporary directories."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.env = os.environ.copy()
+        os.environ.update({
+            'alfred_workflow_bundleid': 'net.deanishe.alfred-vpn-manager',
+            'alfred_workflow_cache': os.path.join(self.tempdir, 'cache'),
+            'alfred_workflow_data': os.path.join(self.tempdir, 'data'),
+            'alfred_workflow_version': '3.2',
+            'alfred_version': '4.0',
+            '_WF_SESSION_ID': 'test',
+        })
+        os.environ.pop('VPN_APP', None)
+        Fake.count = 30
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.env)
+        shutil.rmtree(self.tempdir)
+
+    def new_workflow(self):
+        """Create a new workflow and make it `vpn`'s."""
+        wf = Workflow3()
+        vpn.wf = wf
+        vpn.log = wf.logger
+        vpn.register_cache_policies()
+        return wf
+
+    def do_list(self, query, **attrs):
+        """Run `do_list` and return the items it shows."""
+        wf = self.new_workflow()
+        for key, value in attrs.items():
+            setattr(wf, key, value)
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            vpn.do_list(query)
+        finally:
+            sys.stdout = stdout
+
+        return wf._items
+
+
+class ConfigTests(VPNTestCase):
+    """Read OpenVPN config files."""
+
+    def test_latin1(self):
+        """Latin-1 config files are read"""
+        self.new_workflow()
+        path = os.path.join(self.tempdir, 'config.conf')
+        with open(path, 'wb') as fp:
+            fp.write(u'#viscosity name Zürich\n'
+                     u'# Standort: Zürich\n'
+                     u'proto udp\n'
+                     u'remote zurich.example.com 1194 tcp-client\n'
+                     .encode('latin-1'))
+
+        name, host, protocol = vpn.read_openvpn_config(path)
+        self.assertEqual(name, u'Z\ufffdrich')
+        self.assertEqual(host, u'zurich.example.com')
+        self.assertEqual(protocol, u'TCP')
+
+
+class ListTests(VPNTestCase):
+    """Search connections with `do_list`."""
+
+    def setUp(self):
+        super(ListTests, self).setUp()
+        self.pools = 0
+        self.patches = [patched(vpn, 'get_app', lambda name=None: Fake()),
+                        patched(multiprocessing, 'cpu_count', lambda: 2),
+                        patched(multiprocessing, 'Pool', self.pool)]
+        for p in self.patches:
+            p.__enter__()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.__exit__(None, None, None)
+        super(ListTests, self).tearDown()
+
+    def pool(self, *args, **kwargs):
+        """Count pools started by `Workflow.filter`."""
+        self.pools += 1
+        return multiprocessing.pool.Pool(*args, **kwargs)
+
+    def titles(self, query, **attrs):
+        return [it.title for it in self.do_list(query, **attrs)]
+
+    def test_parallel_ifilter(self):
+        """Connections are scored in a pool by `ifilter`"""
+        Fake.count = 6000
+        serial = self.titles(u'server', parallel_filter_threshold=0)
+        self.assertEqual(self.pools, 0)
+        self.assertEqual(len(serial), vpn.MAX_RESULTS)
+
+        parallel = self.titles(u'server', parallel_filter_threshold=1)
+        self.assertEqual(self.pools, 1)
+        self.assertEqual(parallel, serial)
+
+    def test_parallel_deadline(self):
+        """Connections left at the deadline are scored in a pool"""
+        Fake.count = 6000
+        with patched(vpn, 'DEADLINE_THRESHOLD', 1000):
+            with patched(vpn, 'DEADLINE_MS', 100000):
+                serial = self.titles(u'server',
+                                     parallel_filter_threshold=0)
+            self.assertEqual(self.pools, 0)
+
+            with patched(vpn, 'DEADLINE_MS', 1):
+                parallel = self.titles(u'server',
+                                       parallel_filter_threshold=1)
+            self.assertEqual(self.pools, 1)
+
+        self.assertEqual(len(serial), vpn.MAX_RESULTS)
+        self.assertEqual(parallel, serial)
+
+
+class AppTests(VPNTestCase):
+    """Select another app with ``app:``."""
+
+    def test_other_app(self):
+        """Items of another app set VPN_APP"""
+        items = self.do_list(u'app:fake')
+        self.assertEqual(len(items), 29)
+        for it in items:
+            self.assertEqual(it.variables['action'], 'connect')
+            self.assertEqual(it.variables['VPN_APP'], 'Fake')
+
+        items = self.do_list(u'app:fake is:active')
+        self.assertEqual([it.title for it in items], [u'Server 1 Zürich'])
+        self.assertEqual(items[0].variables['action'], 'disconnect')
+        self.assertEqual(items[0].variables['VPN_APP'], 'Fake')
+
+    def test_configured_app(self):
+        """Items of the configured app don't set VPN_APP"""
+        os.environ['VPN_APP'] = 'Fake'
+        items = self.do_list(u'app:fake')
+        self.assertEqual(len(items), 29)
+        for it in items:
+            self.assertEqual(it.variables['action'], 'connect')
+            self.assertNotIn('VPN_APP', it.variables)
+
+
+if __name__ == '__main__':
+    unittest.main()